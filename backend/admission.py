@@ -0,0 +1,146 @@
+# backend/admission.py
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, Optional, Sequence, Tuple
+from metrics import REGISTRY
+
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "legal_admission_in_flight", "Admitted requests being served, by endpoint class", ("endpoint_class",)
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "legal_admission_queue_depth", "Requests waiting for admission, by endpoint class", ("endpoint_class",)
+)
+ADMISSION_QUEUE_WAIT = REGISTRY.histogram(
+    "legal_admission_queue_wait_seconds", "Time admitted requests waited in the queue", ("endpoint_class",)
+)
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "legal_admission_rejections_total", "Requests shed by admission control", ("endpoint_class", "reason")
+)
+
+
+class Rejected(Exception):
+    """A request was shed; respond with `status_code` and a Retry-After header"""
+
+    def __init__(self, endpoint_class: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"{endpoint_class} requests are over capacity ({reason})")
+        self.endpoint_class = endpoint_class
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionLimit:
+    """Concurrency limit with a bounded FIFO wait queue for one class of endpoints.
+
+    Up to `concurrency` requests run at once and up to `queue_size` more
+    wait, each for at most `queue_timeout` seconds. Anything beyond that is
+    rejected immediately (429 when the queue is full, 503 when the wait
+    times out), so overload in one class cannot build unbounded latency
+    there or starve the others. Used from the event loop only.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        # Moving average of service time, for Retry-After estimates
+        self._service_time = 1.0
+        ADMISSION_IN_FLIGHT.set(0, endpoint_class=name)
+        ADMISSION_QUEUE_DEPTH.set(0, endpoint_class=name)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new arrival"""
+        backlog = (len(self._waiters) + 1) / max(self.concurrency, 1)
+        return max(1, min(60, math.ceil(backlog * self._service_time)))
+
+    def _reject(self, reason: str, status_code: int):
+        ADMISSION_REJECTIONS.inc(endpoint_class=self.name, reason=reason)
+        raise Rejected(self.name, reason, status_code, self.retry_after())
+
+    def _update_gauges(self):
+        ADMISSION_IN_FLIGHT.set(self.active, endpoint_class=self.name)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters), endpoint_class=self.name)
+
+    async def acquire(self):
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self._update_gauges()
+            ADMISSION_QUEUE_WAIT.observe(0, endpoint_class=self.name)
+            return
+        if len(self._waiters) >= self.queue_size:
+            self._reject("queue_full", 429)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release(0)
+            self._update_gauges()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("queue_timeout", 503)
+        ADMISSION_QUEUE_WAIT.observe(time.monotonic() - started, endpoint_class=self.name)
+
+    def release(self, service_time: Optional[float] = None):
+        if service_time:
+            self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        # Hand the slot straight to the next live waiter, in arrival order
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+
+class AdmissionController:
+    """Maps requests to endpoint classes and applies each class's limit"""
+
+    def __init__(self, limits: Dict[str, AdmissionLimit], routes: Sequence[Tuple[str, str, str]]):
+        self.limits = limits
+        self.routes = routes  # (method, path prefix, endpoint class)
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        for route_method, prefix, endpoint_class in self.routes:
+            if method == route_method and (path == prefix or path.startswith(prefix.rstrip("/") + "/")):
+                return endpoint_class
+        return None
+
+    def limit_for(self, method: str, path: str) -> Optional[AdmissionLimit]:
+        endpoint_class = self.classify(method, path)
+        return self.limits.get(endpoint_class) if endpoint_class else None
+
+    @classmethod
+    def from_env(cls, defaults: Dict[str, Tuple[int, int, float]],
+                 routes: Sequence[Tuple[str, str, str]]) -> "AdmissionController":
+        """Limits from ADMISSION_<CLASS>_CONCURRENCY / _QUEUE / _TIMEOUT, falling back to defaults.
+
+        A concurrency of 0 turns admission control off for that class.
+        """
+        limits = {}
+        for name, (concurrency, queue_size, queue_timeout) in defaults.items():
+            prefix = f"ADMISSION_{name.upper()}_"
+            concurrency = int(os.getenv(prefix + "CONCURRENCY", str(concurrency)))
+            if concurrency <= 0:
+                continue
+            limits[name] = AdmissionLimit(
+                name, concurrency,
+                int(os.getenv(prefix + "QUEUE", str(queue_size))),
+                float(os.getenv(prefix + "TIMEOUT", str(queue_timeout))),
+            )
+        return cls(limits, routes)
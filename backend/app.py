@@ -1,15 +1,90 @@
 # backend/app.py
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
 import uvicorn
 import uuid
-from typing import List, Optional
+from typing import List, Optional, Sequence, Dict
+import base64
+import hashlib
 import json
+import logging
+import math
 import os
+import importlib
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from document_processor import LegalDocumentProcessor
-from vector_store import VectorStore
-from legal_analysis import LegalAnalyzer  # Add this line
-app = FastAPI(title="Legal Document Analysis API")
+from vector_store import VectorStore, rerank_lexical
+from legal_analysis import LegalAnalyzer, LLMError, get_openai  # Add this line
+from single_flight import SingleFlight
+from comparison import ClauseComparator
+from near_duplicates import MinHashLSH
+from document_store import DocumentStore
+from lazy_imports import lazy_import
+from metrics import REGISTRY, stage
+from profiler import SamplingProfiler, ProfileStore, activate, deactivate
+from memory import GROUP_BY, SnapshotStore, process_memory
+from admission import AdmissionController, Rejected
+import tracing
+
+np = lazy_import("numpy")
+logger = logging.getLogger(__name__)
+
+# Set once the startup warm-up has loaded the index and warmed caches
+startup_state = {"ready": False, "started": time.time(), "warmup_seconds": None, "attempts": 0, "error": None}
+WARMUP_ATTEMPTS = int(os.getenv("WARMUP_ATTEMPTS", "3"))
+
+def warm_up_once():
+    with stage("startup", "vector_index"):
+        vector_store.refresh()
+        # Drops deleted rows and folds in per-document segments of older indexes
+        vector_store.compact()
+    with stage("startup", "near_duplicates"):
+        # Rebuild the near-duplicate index from the stored signatures
+        for stored_id, signature in documents.minhash_signatures():
+            near_duplicate_index.add(stored_id, np.frombuffer(signature, dtype=np.uint32))
+    with stage("startup", "search"):
+        # Pages in the memory-mapped embeddings and exercises the query path
+        vector_store.search("warm up", limit=1)
+    with stage("startup", "dependencies"):
+        get_openai()
+        importlib.import_module("PyPDF2")
+
+def warm_up():
+    """Load persisted indexes and heavy dependencies before reporting readiness.
+
+    Retried with backoff; a worker whose warm-up keeps failing never becomes ready.
+    """
+    started = time.perf_counter()
+    for attempt in range(1, WARMUP_ATTEMPTS + 1):
+        startup_state["attempts"] = attempt
+        try:
+            warm_up_once()
+        except Exception as e:
+            startup_state["error"] = str(e)
+            logger.error("Error during startup warm-up (attempt %d of %d): %s", attempt, WARMUP_ATTEMPTS, e)
+            if attempt < WARMUP_ATTEMPTS:
+                time.sleep(2 ** (attempt - 1))
+            continue
+        startup_state["error"] = None
+        startup_state["ready"] = True
+        break
+    startup_state["warmup_seconds"] = round(time.perf_counter() - started, 3)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so liveness checks answer right away
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+
+app = FastAPI(title="Legal Document Analysis API", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -20,26 +95,444 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared on-disk state, so several uvicorn workers can serve the same corpus
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
 # Initialize document processor and vector store
 document_processor = LegalDocumentProcessor()
-vector_store = VectorStore()
+vector_store = VectorStore(
+    os.getenv("INDEX_DIR", os.path.join(DATA_DIR, "index")),
+    segment_rows=int(os.getenv("INDEX_SEGMENT_ROWS", "8192")),
+    compact_ratio=float(os.getenv("INDEX_COMPACT_RATIO", "0.25"))
+)
+near_duplicate_index = MinHashLSH()
+
+# Persistent document storage; metadata in memory, full documents loaded on demand
+documents = DocumentStore(
+    os.getenv("DOCUMENT_DB_PATH", os.path.join(DATA_DIR, "documents.db")),
+    cache_size=int(os.getenv("DOCUMENT_CACHE_SIZE", "32"))
+)
+
+def on_document_change(operation: str, document_id: str):
+    """Keep this worker's near-duplicate index in sync with other workers' writes"""
+    if operation == "add":
+        signature = documents.minhash(document_id)
+        if signature is not None:
+            near_duplicate_index.add(document_id, np.frombuffer(signature, dtype=np.uint32))
+    elif operation == "delete":
+        near_duplicate_index.remove(document_id)
+
+documents.add_listener(on_document_change)
+
+# Per-class concurrency limits with bounded wait queues, so a burst of uploads or
+# analyses is shed quickly instead of making search wait behind it
+ADMISSION_DEFAULTS = {
+    # class: (concurrency, queue size, queue timeout in seconds)
+    "upload": (4, 16, 30.0),
+    "analysis": (8, 32, 60.0),
+    "search": (16, 64, 5.0),
+}
+ADMISSION_ROUTES = [
+    ("POST", "/upload", "upload"),
+    ("POST", "/summarize", "analysis"),
+    ("POST", "/risk-assessment", "analysis"),
+    ("POST", "/compare", "analysis"),
+    ("POST", "/compare-many", "analysis"),
+    ("POST", "/ask", "analysis"),
+    ("POST", "/search", "search"),
+]
+admission = AdmissionController.from_env(ADMISSION_DEFAULTS, ADMISSION_ROUTES)
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    limit = admission.limit_for(request.method, request.url.path)
+    if limit is None:
+        return await call_next(request)
+    try:
+        await limit.acquire()
+    except Rejected as e:
+        tracing.set_attribute("admission.rejected", e.reason)
+        return JSONResponse({"detail": str(e)}, status_code=e.status_code,
+                            headers={"Retry-After": str(e.retry_after)})
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        limit.release(time.perf_counter() - start)
+
+@app.middleware("http")
+async def sync_shared_state(request: Request, call_next):
+    """Pick up documents written by other worker processes"""
+    # A database read, kept off the event loop
+    await run_in_threadpool(documents.refresh)
+    return await call_next(request)
+
+# Request and index metrics, exposed at /metrics
+HTTP_REQUESTS = REGISTRY.counter(
+    "legal_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "legal_http_request_duration_seconds", "HTTP request duration by route", ("method", "route")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("legal_http_requests_in_flight", "HTTP requests currently being served")
+REGISTRY.gauge("legal_documents", "Stored documents", function=lambda: len(documents))
+REGISTRY.gauge("legal_vector_index_chunks", "Chunks in the vector index", function=lambda: len(vector_store))
+REGISTRY.gauge("legal_vector_index_segments", "Vector index segments", function=lambda: len(vector_store.segments))
+REGISTRY.gauge("legal_near_duplicate_signatures", "Documents in the near-duplicate index",
+               function=lambda: len(near_duplicate_index.signatures))
+REGISTRY.gauge("legal_analysis_in_flight", "LLM analyses currently running or waiting",
+               function=lambda: analysis_flight.in_flight())
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Root span of each request, continuing the caller's trace if it sent a traceparent"""
+    if not tracing.enabled():
+        return await call_next(request)
+    with tracing.start_span(f"{request.method} {request.url.path}", request.headers.get("traceparent"),
+                            kind="SPAN_KIND_SERVER", **{"http.method": request.method,
+                                                        "http.target": request.url.path}) as span:
+        response = await call_next(request)
+        route = getattr(request.scope.get("route"), "path", None)
+        if route:
+            span.name = f"{request.method} {route}"
+            span.set_attribute("http.route", route)
+        span.set_attribute("http.status_code", response.status_code)
+        response.headers["traceparent"] = span.traceparent
+        response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        # Label by route template, not raw path, to keep label cardinality bounded
+        route = request.scope.get("route")
+        route = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=str(status))
+        HTTP_DURATION.observe(time.perf_counter() - start, method=request.method, route=route)
+
+# Coalesces identical concurrent LLM analysis requests
+analysis_flight = SingleFlight()
+
+def run_analysis(operation: str, document_id: str, fn, background: bool = False, **params):
+    """Run an LLM analysis once for all identical in-flight requests"""
+    analyzer = LegalAnalyzer(background=background)
+    # Interactive requests must not join a background call queued behind the reserve
+    key = (operation, document_id, analyzer.model, background, tuple(sorted(params.items())))
+
+    def compute():
+        result = fn(analyzer)
+        return result, analyzer.last_timing
+
+    (result, timing), shared = analysis_flight.do(key, compute)
+    tracing.set_attribute("analysis.shared", shared)
+    return result, dict(timing, shared=shared)
+
+def store_analysis(document_id: str, name: str, result, timing):
+    """Keep a successful analysis result with the document"""
+    # A reply that could not be parsed should be recomputed on the next request
+    if document_id in documents and timing.get("model_latency") is not None and not timing.get("parse_error"):
+        documents.set_analysis(document_id, name, result)
 
-# In-memory document storage (replace with database in production)
-documents = {}
+@app.exception_handler(LLMError)
+def llm_error(request: Request, exc: LLMError):
+    """LLM calls that failed after retries: 503 with Retry-After if transient, else 502"""
+    tracing.set_attribute("llm.error", str(exc))
+    if exc.retry_after is not None:
+        return JSONResponse({"detail": "The language model is unavailable, please retry later"}, status_code=503,
+                            headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+    return JSONResponse({"detail": str(exc)}, status_code=502)
+
+# "text" assesses the start of the document, "clauses" the identified clause paragraphs
+RISK_ASSESSMENT_MODE = os.getenv("RISK_ASSESSMENT_MODE", "text")
+RISK_TOKEN_BUDGET = int(os.getenv("RISK_TOKEN_BUDGET", "1000"))
+
+def risk_analysis_key(mode: str) -> str:
+    return "risks" if mode == "text" else f"risks_{mode}"
+
+def compute_risks(document_id: str, mode: str, background: bool = False):
+    """Run the risk assessment for a document in the given mode"""
+    if mode == "clauses":
+        clauses = documents.get_fields(document_id, "clauses")["clauses"]
+        return run_analysis(
+            "risk-assessment", document_id,
+            lambda analyzer: analyzer.identify_clause_risks(clauses, RISK_TOKEN_BUDGET),
+            background=background, mode=mode, token_budget=RISK_TOKEN_BUDGET
+        )
+    text = documents.get_fields(document_id, "text")["text"]
+    return run_analysis(
+        "risk-assessment", document_id, lambda analyzer: analyzer.identify_risks(text),
+        background=background, mode=mode
+    )
+
+# Opt-in background computation of summary and risks after upload
+PREFETCH_ANALYSIS = os.getenv("PREFETCH_ANALYSIS", "false").lower() in ("1", "true", "yes")
+prefetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_CONCURRENCY", "1")),
+    thread_name_prefix="prefetch"
+)
+
+def prefetch_analysis(document_id: str, traceparent: Optional[str] = None):
+    """Compute and store the summary and risk assessment at low priority"""
+    # Runs after the upload request has finished, so it continues its trace as a new local root
+    with tracing.start_span("prefetch", traceparent, document_id=document_id):
+        try:
+            text = documents.get_fields(document_id, "text")["text"]
+            summary, timing = run_analysis(
+                "summarize", document_id, lambda analyzer: analyzer.generate_summary(text),
+                background=True
+            )
+            store_analysis(document_id, "summary", summary, timing)
+            risks, timing = compute_risks(document_id, RISK_ASSESSMENT_MODE, background=True)
+            store_analysis(document_id, risk_analysis_key(RISK_ASSESSMENT_MODE), risks, timing)
+        except Exception as e:
+            tracing.set_attribute("error", str(e))
+            logger.warning("Error prefetching analysis for %s: %s", document_id, e)
 
 @app.get("/")
 def read_root():
     return {"message": "Legal Document Analysis API"}
 
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """Readiness: the startup warm-up has finished successfully"""
+    if not startup_state["ready"]:
+        # warmup_seconds is only set once every attempt has failed
+        status = "failed" if startup_state["warmup_seconds"] is not None else "warming_up"
+        return JSONResponse({"status": status, "attempts": startup_state["attempts"],
+                             "error": startup_state["error"]}, status_code=503)
+    return {"status": "ready", "warmup_seconds": startup_state["warmup_seconds"]}
+
+# Admin-only debugging endpoints and request profiling are disabled without a token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def is_admin(request: Request) -> bool:
+    token = request.headers.get("x-admin-token")
+    return bool(ADMIN_TOKEN) and token is not None and secrets.compare_digest(token, ADMIN_TOKEN)
+
+def require_admin(request: Request):
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+# On-demand profiles (X-Profile: 1 or ?profile=1 with the admin token), plus
+# continuous low-rate sampling that keeps profiles of slow requests
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.05"))
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "5"))
+profile_store = ProfileStore(os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles")))
+
+def profile_requested(request: Request) -> bool:
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+    return flag in ("1", "true", "yes") and is_admin(request)
+
+def save_profile(request: Request, profiler: SamplingProfiler, status: int, trigger: str) -> str:
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    profile_store.save(profile_id, {
+        "id": profile_id,
+        "method": request.method,
+        "path": request.url.path,
+        "status": status,
+        "duration": round(profiler.duration, 3),
+        "trigger": trigger,
+        "report": profiler.report(),
+        "folded": profiler.folded(),
+    })
+    return profile_id
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    if profile_requested(request):
+        trigger, interval = "requested", PROFILE_INTERVAL
+    elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        trigger, interval = "slow", PROFILE_SAMPLE_INTERVAL
+    else:
+        return await call_next(request)
+    
+    profiler = SamplingProfiler(interval)
+    token = activate(profiler)
+    profiler.start()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        profiler.stop()
+        deactivate(token)
+        if trigger == "slow" and profiler.duration >= PROFILE_SLOW_SECONDS:
+            profile_id = save_profile(request, profiler, status, trigger)
+            hottest = ", ".join(f"{row['function']} {row['percent']}%" for row in profiler.report(3)["self"])
+            logger.warning("Slow request %s %s took %.2fs (profile %s): %s", request.method,
+                           request.url.path, profiler.duration, profile_id, hottest)
+    if trigger == "requested":
+        response.headers["X-Profile-Id"] = save_profile(request, profiler, status, trigger)
+    return response
+
+@app.get("/debug/profiles")
+def list_profiles(request: Request):
+    """Saved request profiles, newest first"""
+    require_admin(request)
+    return profile_store.list()
+
+@app.get("/debug/profiles/{profile_id}")
+def get_profile(profile_id: str, request: Request, format: str = "json"):
+    """Hot-function report, or collapsed stacks with ?format=folded for flamegraph tools"""
+    require_admin(request)
+    profile = profile_store.load(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(profile["folded"])
+    return profile
+
+# Memory accounting and tracemalloc snapshots (admin only)
+memory_snapshots = SnapshotStore(keep=int(os.getenv("MEMORY_SNAPSHOTS", "5")))
+
+def check_group_by(group_by: str):
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(GROUP_BY)}")
+
+@app.get("/debug/memory")
+def get_memory(request: Request, documents_limit: int = Query(20, ge=0, le=1000, alias="documents")):
+    """Process RSS, approximate bytes by component, and the largest documents' footprints"""
+    require_admin(request)
+    vector_store.refresh()
+    components = {
+        **documents.memory_usage(),
+        **vector_store.memory_usage(),
+        **near_duplicate_index.memory_usage(),
+    }
+    index_footprints = vector_store.document_footprints()
+    footprints = documents.footprints(documents_limit)
+    for footprint in footprints:
+        footprint["index"] = index_footprints.get(footprint["id"], {"chunks": 0, "embedding_bytes": 0, "chunk_text_bytes": 0})
+        footprint["cached_bytes"] = documents.cached_size(footprint["id"])
+    return {
+        "process": process_memory(),
+        "components": components,
+        "documents": {"count": len(documents), "largest": footprints},
+        "tracemalloc": memory_snapshots.status(),
+    }
+
+@app.post("/debug/memory/tracemalloc")
+def start_tracemalloc(request: Request, frames: int = Query(1, ge=1, le=100)):
+    """Start tracing allocations (costs CPU and memory while on)"""
+    require_admin(request)
+    memory_snapshots.start(frames)
+    return memory_snapshots.status()
+
+@app.delete("/debug/memory/tracemalloc")
+def stop_tracemalloc(request: Request):
+    """Stop tracing allocations and drop the snapshots"""
+    require_admin(request)
+    memory_snapshots.stop()
+    return memory_snapshots.status()
+
+@app.post("/debug/memory/snapshots")
+def take_memory_snapshot(request: Request, group_by: str = "lineno", limit: int = Query(20, ge=1, le=500),
+                         compare_to: Optional[str] = None):
+    """Take a tracemalloc snapshot; returns its top allocations, or the diff against `compare_to`"""
+    require_admin(request)
+    check_group_by(group_by)
+    if not memory_snapshots.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc is not running; POST /debug/memory/tracemalloc first")
+    previous = memory_snapshots.get(compare_to) if compare_to else None
+    if compare_to and previous is None:
+        raise HTTPException(status_code=404, detail="Snapshot to compare to not found")
+    snapshot_id = memory_snapshots.take()
+    return memory_snapshot_report(snapshot_id, group_by, limit, compare_to)
+
+@app.get("/debug/memory/snapshots")
+def list_memory_snapshots(request: Request):
+    """Kept tracemalloc snapshots, newest first"""
+    require_admin(request)
+    return memory_snapshots.list()
+
+@app.get("/debug/memory/snapshots/{snapshot_id}")
+def get_memory_snapshot(snapshot_id: str, request: Request, group_by: str = "lineno",
+                        limit: int = Query(20, ge=1, le=500), compare_to: Optional[str] = None):
+    """Top allocations of a kept snapshot, or its diff against another (?compare_to=)"""
+    require_admin(request)
+    check_group_by(group_by)
+    return memory_snapshot_report(snapshot_id, group_by, limit, compare_to)
+
+def memory_snapshot_report(snapshot_id: str, group_by: str, limit: int, compare_to: Optional[str]):
+    snapshot = memory_snapshots.get(snapshot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    report = {"id": snapshot_id, "group_by": group_by,
+              "total_bytes": sum(stat.size for stat in snapshot.statistics("filename"))}
+    if compare_to:
+        previous = memory_snapshots.get(compare_to)
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Snapshot to compare to not found")
+        report["compare_to"] = compare_to
+        report["diff"] = memory_snapshots.compare(snapshot, previous, group_by, limit)
+    else:
+        report["top"] = memory_snapshots.top(snapshot, group_by, limit)
+    return report
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics for this worker process"""
+    vector_store.refresh()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def tag_chunk_clause_types(chunks: List[str], clauses: Dict[str, list],
+                           previous_tags: Optional[Dict[str, Optional[str]]] = None,
+                           changed_clauses: Sequence[str] = ()) -> List[Optional[str]]:
+    """Most relevant clause type of each chunk: the first type with a paragraph inside it.
+    
+    Chunks a previous revision already had keep their tag (`previous_tags`,
+    by chunk text) unless a clause paragraph that was added or removed in
+    this revision occurs in them.
+    """
+    clause_types = []
+    for chunk in chunks:
+        if previous_tags is not None and chunk in previous_tags and \
+                not any(paragraph in chunk for paragraph in changed_clauses):
+            clause_types.append(previous_tags[chunk])
+            continue
+        # Find most relevant clause type for this chunk
+        chunk_clause_type = None
+        for clause_type, clause_paragraphs in clauses.items():
+            for _, full_clause in clause_paragraphs:
+                if full_clause in chunk:
+                    chunk_clause_type = clause_type
+                    break
+            if chunk_clause_type:
+                break
+        clause_types.append(chunk_clause_type)
+    return clause_types
+
+# A plain def, so FastAPI runs it in its threadpool rather than on the event loop
 @app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and process a legal document"""
+def upload_document(file: UploadFile = File(...), parent_id: Optional[str] = Form(None)):
+    """Upload and process a legal document
+    
+    With `parent_id`, the file is stored as a revision of that document: only
+    regions that changed are re-chunked, re-embedded and re-tagged.
+    """
+    if parent_id and parent_id not in documents:
+        raise HTTPException(status_code=404, detail="Parent document not found")
     try:
         # Generate unique ID for document
         document_id = str(uuid.uuid4())
         
         # Read file content
-        file_content = await file.read()
+        file_content = file.file.read()
         
         # Process document based on file type
         if file.filename.lower().endswith('.pdf'):
@@ -49,43 +542,74 @@ async def upload_document(file: UploadFile = File(...)):
         else:
             raise HTTPException(status_code=400, detail="Unsupported file type. Only PDF and TXT files are supported.")
         
-        # Split text into chunks
-        chunks = document_processor.chunk_document(text)
+        tracing.set_attribute("document.id", document_id)
+        tracing.set_attribute("document.bytes", len(file_content))
+        tracing.set_attribute("document.chars", len(text))
+        
+        previous_chunks = []
+        if parent_id:
+            tracing.set_attribute("revision.parent_id", parent_id)
+            parent = documents.get_fields(parent_id, "text", "clauses")
+            previous_chunks = vector_store.document_chunks(parent_id)
+            # Split text into chunks, keeping the parent's chunks where nothing changed
+            chunks = document_processor.chunk_revision(
+                parent["text"], [chunk["content"] for chunk in previous_chunks], text
+            )
+            # Identify clause types, reusing the parent's for unchanged paragraphs
+            clauses = document_processor.identify_clause_types(text, parent["text"], parent["clauses"])
+        else:
+            # Split text into chunks
+            chunks = document_processor.chunk_document(text)
+            
+            # Identify clause types
+            clauses = document_processor.identify_clause_types(text)
         
         # Extract legal entities
         entities = document_processor.extract_legal_entities(text)
         
-        # Identify clause types
-        clauses = document_processor.identify_clause_types(text)
+        # Near-duplicate signature, persisted with the document
+        with stage("upload", "minhash"):
+            signature = near_duplicate_index.signature(text)
         
-        # Store document in memory
-        documents[document_id] = {
-            "id": document_id,
-            "filename": file.filename,
-            "text": text,
-            "entities": entities,
-            "clauses": {k: [item[1] for item in v] for k, v in clauses.items()},
-            "clause_summaries": {k: [item[0] for item in v] for k, v in clauses.items()}
-        }
+        # Store document
+        with stage("upload", "store"):
+            documents.add(document_id, {
+                "id": document_id,
+                "filename": file.filename,
+                "parent_id": parent_id,
+                "text": text,
+                "entities": entities,
+                "clauses": {k: [item[1] for item in v] for k, v in clauses.items()},
+                "clause_summaries": {k: [item[0] for item in v] for k, v in clauses.items()}
+            }, minhash=signature.tobytes() if signature is not None else None)
         
         # Store in vector database
-        clause_types = []
-        for chunk in chunks:
-            # Find most relevant clause type for this chunk
-            chunk_clause_type = None
-            for clause_type, clause_paragraphs in clauses.items():
-                for _, full_clause in clause_paragraphs:
-                    if full_clause in chunk:
-                        chunk_clause_type = clause_type
-                        break
-                if chunk_clause_type:
-                    break
-            clause_types.append(chunk_clause_type)
+        with stage("upload", "chunk_clause_types"):
+            if parent_id:
+                changed_clauses = set()
+                for clause_type in clauses:
+                    previous = set(parent["clauses"].get(clause_type, []))
+                    current = {full_clause for _, full_clause in clauses[clause_type]}
+                    changed_clauses |= previous ^ current
+                clause_types = tag_chunk_clause_types(
+                    chunks, clauses, {chunk["content"]: chunk["clause_type"] for chunk in previous_chunks},
+                    changed_clauses
+                )
+            else:
+                clause_types = tag_chunk_clause_types(chunks, clauses)
+        
+        # Unchanged chunks of a revision keep their embeddings
+        reuse = {chunk["content"]: chunk["embedding"] for chunk in previous_chunks}
+        reused_chunks = sum(1 for chunk in chunks if chunk in reuse)
+        tracing.set_attribute("revision.reused_chunks", reused_chunks)
+        vector_store.add_document(document_id, file.filename, chunks, clause_types, reuse)
+        near_duplicate_index.add(document_id, signature)
         
-        vector_store.add_document(document_id, file.filename, chunks, clause_types)
+        if PREFETCH_ANALYSIS:
+            prefetch_executor.submit(prefetch_analysis, document_id, tracing.current_traceparent())
         
         # Return basic document information
-        return {
+        result = {
             "document_id": document_id,
             "filename": file.filename,
             "content_preview": text[:200] + "..." if len(text) > 200 else text,
@@ -93,101 +617,348 @@ async def upload_document(file: UploadFile = File(...)):
             "entities": entities,
             "clause_summaries": {k: [item[0] for item in v] for k, v in clauses.items()}
         }
+        if parent_id:
+            result["parent_id"] = parent_id
+            result["reused_chunks"] = reused_chunks
+        return result
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Fields clients can request with ?fields=
+LIST_FIELDS = ("id", "filename", "preview", "created_at", "num_chars", "parent_id")
+DETAIL_FIELDS = ("id", "filename", "preview", "created_at", "num_chars", "parent_id", "text", "entities", "clauses")
+# Response fields stored under a different column name
+FIELD_COLUMNS = {"clauses": "clause_summaries"}
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str], default: Sequence[str]) -> List[str]:
+    """Validate a comma-separated ?fields= projection"""
+    if not fields:
+        return list(default)
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    invalid = [field for field in selected if field not in allowed]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(invalid)}. Allowed: {', '.join(allowed)}")
+    return selected
+
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().replace("W/", "", 1) == etag for tag in if_none_match.split(","))
+
+def conditional_response(request: Request, etag: str, payload=None, content: bytes = None,
+                         status_code: int = 200, headers: Dict[str, str] = None,
+                         media_type: str = None) -> Response:
+    """Response with an ETag, or 304 Not Modified if the client already has this version"""
+    headers = dict(headers or {}, ETag=etag)
+    headers["Cache-Control"] = "private, no-cache"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if content is not None:
+        return Response(content=content, status_code=status_code, headers=headers, media_type=media_type)
+    return JSONResponse(payload, status_code=status_code, headers=headers)
+
+def encode_cursor(doc: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([doc["created_at"], doc["id"]]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(document_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/documents")
-def get_documents():
-    """Get list of all uploaded documents"""
+def get_documents(request: Request, limit: int = Query(100, ge=1, le=1000),
+                  cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get a page of uploaded documents; follow X-Next-Cursor for the next page"""
+    selected = parse_fields(fields, LIST_FIELDS, ("id", "filename", "preview"))
+    page = documents.page(decode_cursor(cursor) if cursor else None, limit + 1)
+    has_more = len(page) > limit
+    page = page[:limit]
+    
     result = []
-    for doc_id, doc in documents.items():
-        result.append({
-            "id": doc_id,
-            "filename": doc["filename"],
-            "preview": doc["text"][:200] + "..." if len(doc["text"]) > 200 else doc["text"]
-        })
-    return result
+    for doc in page:
+        result.append({field: doc[field] for field in selected})
+    
+    headers = {}
+    if has_more:
+        next_cursor = encode_cursor(page[-1])
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    etag = make_etag("documents", selected, cursor, has_more, [(doc["id"], doc["content_hash"]) for doc in page])
+    return conditional_response(request, etag, result, headers=headers)
 
 @app.get("/documents/{document_id}")
-def get_document(document_id: str):
-    """Get document details by ID"""
+def get_document(document_id: str, request: Request, fields: Optional[str] = None):
+    """Get document details by ID, optionally only some fields (?fields=id,filename,entities)"""
     if document_id not in documents:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc = documents[document_id]
+    selected = parse_fields(fields, DETAIL_FIELDS, ("id", "filename", "text", "entities", "clauses"))
+    metadata = documents.metadata(document_id)
+    etag = make_etag("document", document_id, metadata["content_hash"], selected)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return conditional_response(request, etag)
+    
+    # Only load the heavy columns that were asked for
+    columns = [FIELD_COLUMNS.get(field, field) for field in selected if field not in metadata]
+    doc = dict(metadata, **documents.get_fields(document_id, *columns)) if columns else metadata
+    result = {field: doc[FIELD_COLUMNS.get(field, field)] for field in selected}
+    return conditional_response(request, etag, result)
+
+@app.delete("/documents/{document_id}")
+def delete_document(document_id: str):
+    """Delete a document from the store, the search index and the analytics"""
+    if document_id not in documents:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    del documents[document_id]
+    vector_store.delete_document(document_id)
+    near_duplicate_index.remove(document_id)
+    return {"document_id": document_id, "deleted": True}
+
+@app.get("/documents/{document_id}/text")
+def get_document_text(document_id: str, request: Request, offset: int = Query(0, ge=0),
+                      length: Optional[int] = Query(None, ge=0)):
+    """Get part of a document's text by character offset, or by byte range with a Range header"""
+    if document_id not in documents:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    content_hash = documents.metadata(document_id)["content_hash"]
+    range_header = request.headers.get("range")
+    if range_header:
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+        if not match or match.groups() == ("", ""):
+            raise HTTPException(status_code=416, detail="Only single byte ranges are supported")
+        _, total = documents.text_range(document_id, 0, 0, unit="bytes")
+        first, last = match.groups()
+        if first == "":
+            # Suffix range: the last N bytes
+            start, end = max(total - int(last), 0), total - 1
+        else:
+            start = int(first)
+            end = min(int(last), total - 1) if last else total - 1
+        if start >= total or start > end:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+        data, _ = documents.text_range(document_id, start, end - start + 1, unit="bytes")
+        return conditional_response(
+            request, make_etag("text", document_id, content_hash, start, end), content=data,
+            status_code=206, media_type="text/plain; charset=utf-8",
+            headers={"Content-Range": f"bytes {start}-{end}/{total}", "Accept-Ranges": "bytes"}
+        )
+    
+    text, total = documents.text_range(document_id, offset, length)
+    return conditional_response(
+        request, make_etag("text", document_id, content_hash, offset, length), content=text.encode("utf-8"),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Total-Chars": str(total), "Accept-Ranges": "bytes"}
+    )
+
+@app.get("/documents/{document_id}/near-duplicates")
+def get_near_duplicates(document_id: str, threshold: float = Query(0.5, ge=0, le=1),
+                        limit: int = Query(10, ge=1, le=1000)):
+    """Find near-identical versions of a document with estimated Jaccard similarity"""
+    if document_id not in documents:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    results = []
+    for result in near_duplicate_index.query(document_id, threshold, limit):
+        # Skip documents deleted since the index lookup
+        try:
+            result["filename"] = documents.metadata(result["document_id"])["filename"]
+        except KeyError:
+            continue
+        results.append(result)
+    return results
+
+@app.get("/near-duplicates/clusters")
+def get_near_duplicate_clusters(threshold: float = Query(0.8, ge=0, le=1)):
+    """Group the corpus into clusters of near-duplicate documents"""
+    clusters = []
+    for cluster in near_duplicate_index.clusters(threshold):
+        members = []
+        for doc_id in cluster:
+            # Skip documents deleted since the index lookup
+            try:
+                members.append({"id": doc_id, "filename": documents.metadata(doc_id)["filename"]})
+            except KeyError:
+                continue
+        if len(members) > 1:
+            clusters.append(members)
     return {
-        "id": doc["id"],
-        "filename": doc["filename"],
-        "text": doc["text"],
-        "entities": doc["entities"],
-        "clauses": doc["clause_summaries"]
+        "threshold": threshold,
+        "num_documents": len(documents),
+        "num_clusters": len(clusters),
+        "clusters": clusters
     }
 
+@app.get("/analytics")
+def get_analytics(request: Request, top: int = Query(10, ge=1, le=100)):
+    """Corpus-wide clause type, entity type and risk severity counts, and the most mentioned parties
+    
+    Served from aggregates updated with every upload, delete and stored risk
+    assessment, so the cost does not grow with the number of documents.
+    """
+    result = documents.analytics(top_parties=top)
+    return conditional_response(request, make_etag("analytics", result), result)
+
 @app.post("/search")
 def search_documents(query: str = Form(...)):
     """Search for content across documents"""
     results = vector_store.search(query)
+    tracing.set_attribute("search.results", len(results))
     return results
 
+# Retrieved chunks and prompt tokens per question, so the prompt size does not grow with the documents
+ASK_TOP_K = int(os.getenv("ASK_TOP_K", "5"))
+ASK_TOKEN_BUDGET = int(os.getenv("ASK_TOKEN_BUDGET", "1500"))
+# Vector candidates re-ranked by BM25 before the top k are kept
+ASK_CANDIDATES = int(os.getenv("ASK_CANDIDATES", "50"))
+
+@app.post("/ask")
+def ask_question(question: str = Form(..., min_length=1, max_length=2000),
+                 document_id: Optional[str] = Form(None), k: int = Form(ASK_TOP_K, ge=1, le=20)):
+    """Answer a question from the most relevant chunks of one document or the whole corpus"""
+    if document_id is not None and document_id not in documents:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    def answer(analyzer):
+        candidates = vector_store.search(question, limit=max(k, ASK_CANDIDATES), document_id=document_id)
+        with stage("ask", "rerank"):
+            chunks = rerank_lexical(question, candidates, k)
+        tracing.set_attribute("ask.candidates", len(candidates))
+        tracing.set_attribute("ask.chunks", len(chunks))
+        return analyzer.answer_question(question, chunks, ASK_TOKEN_BUDGET)
+
+    result, timing = run_analysis(
+        "ask", document_id or "", answer, question=question, k=k, token_budget=ASK_TOKEN_BUDGET
+    )
+    return dict(result, timing=timing)
+
 @app.get("/clauses/{document_id}")
-def get_document_clauses(document_id: str):
+def get_document_clauses(document_id: str, request: Request):
     """Get all identified clauses for a document"""
     if document_id not in documents:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc = documents[document_id]
-    return doc["clause_summaries"]
+    etag = make_etag("clauses", document_id, documents.metadata(document_id)["content_hash"])
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return conditional_response(request, etag)
+    return conditional_response(
+        request, etag, documents.get_fields(document_id, "clause_summaries")["clause_summaries"]
+    )
 
 # Updated endpoints to add to backend/app.py
 
 @app.post("/summarize/{document_id}")
-def summarize_document(document_id: str):
+def summarize_document(document_id: str, refresh: bool = False):
     """Generate a plain language summary of a document"""
     if document_id not in documents:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Initialize legal analyzer
-    analyzer = LegalAnalyzer()
+    # Serve a stored (e.g. prefetched) summary when available
+    analysis = documents.get_fields(document_id, "analysis")["analysis"]
+    tracing.set_attribute("analysis.cache_hit", not refresh and "summary" in analysis)
+    if not refresh and "summary" in analysis:
+        return {"summary": analysis["summary"], "timing": {"stored": True}}
     
     # Generate summary
-    doc = documents[document_id]
-    summary = analyzer.generate_summary(doc["text"])
+    text = documents.get_fields(document_id, "text")["text"]
+    summary, timing = run_analysis(
+        "summarize", document_id, lambda analyzer: analyzer.generate_summary(text)
+    )
+    store_analysis(document_id, "summary", summary, timing)
     
-    return {"summary": summary}
+    return {"summary": summary, "timing": timing}
 
 @app.post("/risk-assessment/{document_id}")
-def assess_risks(document_id: str):
+def assess_risks(document_id: str, refresh: bool = False, mode: Optional[str] = None):
     """Identify potential risks in a document"""
     if document_id not in documents:
         raise HTTPException(status_code=404, detail="Document not found")
+    mode = mode or RISK_ASSESSMENT_MODE
+    if mode not in ("text", "clauses"):
+        raise HTTPException(status_code=400, detail="Risk assessment mode must be 'text' or 'clauses'")
     
-    # Initialize legal analyzer
-    analyzer = LegalAnalyzer()
+    # Serve a stored (e.g. prefetched) risk assessment when available
+    analysis = documents.get_fields(document_id, "analysis")["analysis"]
+    key = risk_analysis_key(mode)
+    tracing.set_attribute("analysis.cache_hit", not refresh and key in analysis)
+    if not refresh and key in analysis:
+        return {"risks": analysis[key], "timing": {"stored": True}}
     
     # Generate risk assessment
-    doc = documents[document_id]
-    risks = analyzer.identify_risks(doc["text"])
+    risks, timing = compute_risks(document_id, mode)
+    store_analysis(document_id, key, risks, timing)
     
-    return {"risks": risks}
+    return {"risks": risks, "timing": timing}
+
+def compare_with_clauses(comparator: ClauseComparator, doc1_id: str, doc2_id: str, use_llm: bool):
+    """Locally align and diff two documents, then explain only the material differences"""
+    comparison = comparator.compare(documents.get_fields(doc1_id, "clauses")["clauses"],
+                                    documents.get_fields(doc2_id, "clauses")["clauses"])
+    comparison["doc1_id"] = doc1_id
+    comparison["doc2_id"] = doc2_id
+    if use_llm:
+        differences = comparison["material_differences"]
+        comparison["analysis"], _ = run_analysis(
+            "compare", doc1_id, lambda analyzer: analyzer.compare_clause_differences(differences),
+            doc2_id=doc2_id
+        )
+    return comparison
 
 @app.post("/compare")
-def compare_documents(doc1_id: str = Form(...), doc2_id: str = Form(...)):
+def compare_documents(doc1_id: str = Form(...), doc2_id: str = Form(...), use_llm: bool = Form(True)):
     """Compare two documents and identify differences"""
     if doc1_id not in documents:
         raise HTTPException(status_code=404, detail="First document not found")
     if doc2_id not in documents:
         raise HTTPException(status_code=404, detail="Second document not found")
     
-    # Initialize legal analyzer
-    analyzer = LegalAnalyzer()
+    comparator = ClauseComparator(vector_store.embed_text)
+    return compare_with_clauses(comparator, doc1_id, doc2_id, use_llm)
+
+@app.post("/compare-many")
+def compare_many_documents(base_id: str = Form(...), other_ids: List[str] = Form(...),
+                           use_llm: bool = Form(True)):
+    """Compare one document against several others"""
+    if base_id not in documents:
+        raise HTTPException(status_code=404, detail="Base document not found")
+    other_ids = list(dict.fromkeys(doc_id for doc_id in other_ids if doc_id != base_id))
+    missing = [doc_id for doc_id in other_ids if doc_id not in documents]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Documents not found: {', '.join(missing)}")
+    
+    # One comparator so the base document's clause embeddings are computed once
+    comparator = ClauseComparator(vector_store.embed_text)
+    base_clauses = documents.get_fields(base_id, "clauses")["clauses"]
+    local = {doc_id: comparator.compare(base_clauses, documents.get_fields(doc_id, "clauses")["clauses"])
+             for doc_id in other_ids}
     
-    # Compare documents
-    doc1 = documents[doc1_id]
-    doc2 = documents[doc2_id]
-    comparison = analyzer.compare_documents(doc1["text"], doc2["text"])
+    def explain(doc_id):
+        differences = local[doc_id]["material_differences"]
+        analysis, _ = run_analysis(
+            "compare", base_id, lambda analyzer: analyzer.compare_clause_differences(differences),
+            doc2_id=doc_id
+        )
+        return analysis
     
-    return comparison
+    if use_llm and other_ids:
+        with ThreadPoolExecutor(max_workers=min(len(other_ids), 8)) as executor:
+            for doc_id, analysis in zip(other_ids, executor.map(tracing.in_current_trace(explain), other_ids)):
+                local[doc_id]["analysis"] = analysis
+    
+    return {
+        "base_id": base_id,
+        "comparisons": [dict(local[doc_id], doc1_id=base_id, doc2_id=doc_id) for doc_id in other_ids]
+    }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Multiple workers need the app as an import string
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=int(os.getenv("WEB_CONCURRENCY", "1")))
\ No newline at end of file
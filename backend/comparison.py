@@ -0,0 +1,145 @@
+# backend/comparison.py
+import difflib
+import re
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def _words(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+class ClauseComparator:
+    """Local clause-aligned comparison of two documents.
+
+    Clauses are aligned within each clause type by word-level text
+    similarity, with embedding similarity only breaking ties (the simple
+    embeddings score unrelated texts almost as high as related ones), then
+    aligned pairs are diffed word by word. Only pairs
+    that differ materially (or clauses with no counterpart) need to be sent
+    to the LLM.
+    """
+
+    def __init__(self, embed_fn: Callable[[str], List[float]],
+                 match_threshold: float = 0.5, material_threshold: float = 0.9):
+        self.embed_fn = embed_fn
+        self.match_threshold = match_threshold
+        self.material_threshold = material_threshold
+        self._embeddings = {}
+
+    def _embedding(self, text: str) -> "np.ndarray":
+        if text not in self._embeddings:
+            vector = np.asarray(self.embed_fn(text), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            self._embeddings[text] = vector / norm if norm else vector
+        return self._embeddings[text]
+
+    def _similarity(self, a: str, b: str) -> Optional[float]:
+        """Word-level similarity of two clauses, or None when it is below the match threshold"""
+        matcher = difflib.SequenceMatcher(None, _words(a), _words(b), autojunk=False)
+        # The quick ratios are upper bounds; only pay for ratio() when it could match
+        if matcher.real_quick_ratio() < self.match_threshold or matcher.quick_ratio() < self.match_threshold:
+            return None
+        ratio = matcher.ratio()
+        return ratio if ratio >= self.match_threshold else None
+
+    def align(self, clauses_a: List[str], clauses_b: List[str]) -> Tuple[List[Tuple[int, int, float]], List[int], List[int]]:
+        """Greedily pair the most similar clauses of one type"""
+        scored = []
+        for i, a in enumerate(clauses_a):
+            for j, b in enumerate(clauses_b):
+                score = 1.0 if a == b else self._similarity(a, b)
+                if score is not None:
+                    cosine = float(np.dot(self._embedding(a), self._embedding(b)))
+                    scored.append((score, cosine, i, j))
+        scored.sort(reverse=True)
+
+        used_a, used_b, pairs = set(), set(), []
+        for score, _, i, j in scored:
+            if i in used_a or j in used_b:
+                continue
+            used_a.add(i)
+            used_b.add(j)
+            pairs.append((i, j, score))
+        only_a = [i for i in range(len(clauses_a)) if i not in used_a]
+        only_b = [j for j in range(len(clauses_b)) if j not in used_b]
+        return pairs, only_a, only_b
+
+    @staticmethod
+    def diff(a: str, b: str) -> Dict[str, Any]:
+        """Word-level diff of two aligned clauses"""
+        words_a, words_b = a.split(), b.split()
+        matcher = difflib.SequenceMatcher(None, words_a, words_b, autojunk=False)
+        changes = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            changes.append({
+                "type": tag,
+                "removed": " ".join(words_a[i1:i2]),
+                "added": " ".join(words_b[j1:j2]),
+            })
+        return {"ratio": round(matcher.ratio(), 3), "changes": changes}
+
+    @staticmethod
+    def _deduplicate(clauses: Dict[str, List[str]], clause_types: List[str]) -> Dict[str, List[str]]:
+        """Keep each paragraph only under the first clause type it matched"""
+        seen = set()
+        unique = {}
+        for clause_type in clause_types:
+            unique[clause_type] = []
+            for paragraph in clauses.get(clause_type, []):
+                if paragraph.strip() and paragraph not in seen:
+                    seen.add(paragraph)
+                    unique[clause_type].append(paragraph)
+        return unique
+
+    def compare(self, clauses_a: Dict[str, List[str]], clauses_b: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Align and diff the clauses of two documents by clause type"""
+        clause_types = list(clauses_a) + [t for t in clauses_b if t not in clauses_a]
+        clauses_a = self._deduplicate(clauses_a, clause_types)
+        clauses_b = self._deduplicate(clauses_b, clause_types)
+
+        result = {"clauses": {}, "material_differences": []}
+        identical = total = 0
+        for clause_type in clause_types:
+            paragraphs_a = clauses_a.get(clause_type, [])
+            paragraphs_b = clauses_b.get(clause_type, [])
+            pairs, only_a, only_b = self.align(paragraphs_a, paragraphs_b)
+
+            matched = []
+            for i, j, score in pairs:
+                a, b = paragraphs_a[i], paragraphs_b[j]
+                diff = {"ratio": 1.0, "changes": []} if a == b else self.diff(a, b)
+                matched.append({"doc1_index": i, "doc2_index": j, "similarity": round(score, 3), **diff})
+                if diff["ratio"] < self.material_threshold:
+                    result["material_differences"].append({
+                        "clause_type": clause_type, "kind": "changed",
+                        "doc1_clause": a, "doc2_clause": b, "changes": diff["changes"],
+                    })
+                else:
+                    identical += 1
+            for i in only_a:
+                result["material_differences"].append({
+                    "clause_type": clause_type, "kind": "only_in_doc1", "doc1_clause": paragraphs_a[i],
+                })
+            for j in only_b:
+                result["material_differences"].append({
+                    "clause_type": clause_type, "kind": "only_in_doc2", "doc2_clause": paragraphs_b[j],
+                })
+            total += len(pairs) + len(only_a) + len(only_b)
+
+            if paragraphs_a or paragraphs_b:
+                result["clauses"][clause_type] = {
+                    "doc1_count": len(paragraphs_a),
+                    "doc2_count": len(paragraphs_b),
+                    "matched": matched,
+                    "only_in_doc1": only_a,
+                    "only_in_doc2": only_b,
+                }
+        result["similarity"] = round(identical / total, 3) if total else 1.0
+        return result
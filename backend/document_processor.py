@@ -1,8 +1,10 @@
 # backend/document_processor.py
-import PyPDF2
 import re
-from typing import List, Dict, Any, Tuple
+from difflib import SequenceMatcher
+from typing import List, Dict, Any, Optional, Tuple
 from io import BytesIO
+from metrics import timed
+from tracing import set_attribute
 
 class LegalDocumentProcessor:
     def __init__(self):
@@ -20,10 +22,14 @@ class LegalDocumentProcessor:
             "warranties": ["warrant", "represent", "guarantee"]
         }
     
+    @timed("processor", "pdf_extraction")
     def extract_text_from_pdf(self, pdf_file: bytes) -> str:
         """Extract text from a PDF file"""
         try:
+            import PyPDF2  # Deferred: only needed for PDF uploads
+
             pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_file))
+            set_attribute("pdf.pages", len(pdf_reader.pages))
             text = ""
             for page in pdf_reader.pages:
                 text += page.extract_text() + "\n"
@@ -32,6 +38,7 @@ class LegalDocumentProcessor:
             print(f"Error extracting text from PDF: {e}")
             return ""
 
+    @timed("processor", "txt_extraction")
     def extract_text_from_txt(self, text_file: bytes) -> str:
         """Extract text from a TXT file"""
         try:
@@ -40,14 +47,89 @@ class LegalDocumentProcessor:
             print(f"Error extracting text from TXT: {e}")
             return ""
             
+    @timed("processor", "chunking")
     def chunk_document(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
         """Split document into overlapping chunks"""
         chunks = []
         for i in range(0, len(text), chunk_size - overlap):
             chunk = text[i:i + chunk_size]
             chunks.append(chunk)
+        set_attribute("document.chunks", len(chunks))
+        return chunks
+    
+    @staticmethod
+    def unchanged_regions(previous_text: str, text: str) -> List[Tuple[int, int, int]]:
+        """(previous_start, start, length) of text regions a revision kept, from a line diff"""
+        previous_lines = previous_text.splitlines(keepends=True)
+        lines = text.splitlines(keepends=True)
+        previous_offsets = [0]
+        for line in previous_lines:
+            previous_offsets.append(previous_offsets[-1] + len(line))
+        offsets = [0]
+        for line in lines:
+            offsets.append(offsets[-1] + len(line))
+        matcher = SequenceMatcher(None, previous_lines, lines, autojunk=False)
+        return [(previous_offsets[i], offsets[j], previous_offsets[i + size] - previous_offsets[i])
+                for i, j, size in matcher.get_matching_blocks() if size]
+    
+    @timed("processor", "chunking")
+    def chunk_revision(self, previous_text: str, previous_chunks: List[str], text: str,
+                       chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+        """Chunk a revised document, keeping the previous version's chunks in unchanged regions.
+        
+        Only the changed regions between kept chunks (plus `overlap` characters
+        of context on each side) are chunked anew, so the kept chunks' index
+        entries can be reused. Chunks keep `chunk_size` and overlap by at least
+        `overlap` as in chunk_document, and match it exactly when no edit
+        changed the text's length. Otherwise kept chunks stay where the
+        previous version put them, shifted by the edits before them, rather
+        than on chunk_document's fixed offsets.
+        """
+        # Where each previous chunk starts; chunks are in document order
+        chunk_spans = []
+        position = 0
+        for chunk in previous_chunks:
+            start = previous_text.find(chunk, position)
+            if start < 0:
+                start = previous_text.find(chunk)
+            if start >= 0:
+                chunk_spans.append((start, start + len(chunk)))
+                position = start + 1
+        
+        # Previous chunks lying entirely inside an unchanged region, in revision offsets
+        kept = []
+        for previous_start, start, length in self.unchanged_regions(previous_text, text):
+            for chunk_start, chunk_end in chunk_spans:
+                if chunk_start >= previous_start and chunk_end <= previous_start + length:
+                    kept.append((chunk_start - previous_start + start, chunk_end - previous_start + start))
+        kept.sort()
+        
+        chunks = []
+        covered = 0
+        for start, end in kept:
+            if start > covered:
+                # Rechunk the gap, overlapping the kept chunks around it
+                gap_start = max(0, covered - overlap) if chunks else 0
+                gap = text[gap_start:min(len(text), start + overlap)]
+                # Stop at the chunk reaching the kept chunk; later ones would lie inside it
+                for i in range(0, len(gap), chunk_size - overlap):
+                    chunks.append(gap[i:i + chunk_size])
+                    if i + chunk_size >= len(gap):
+                        break
+            elif end <= covered:
+                continue
+            chunks.append(text[start:end])
+            covered = end
+        if covered < len(text):
+            gap_start = max(0, covered - overlap) if chunks else 0
+            gap = text[gap_start:]
+            chunks.extend(gap[i:i + chunk_size] for i in range(0, len(gap), chunk_size - overlap))
+        
+        set_attribute("document.chunks", len(chunks))
+        set_attribute("revision.kept_chunks", len(kept))
         return chunks
     
+    @timed("processor", "entities")
     def extract_legal_entities(self, text: str) -> Dict[str, List[str]]:
         """Extract basic legal entities from text"""
         entities = {
@@ -72,16 +154,31 @@ class LegalDocumentProcessor:
         
         return entities
     
-    def identify_clause_types(self, text: str) -> Dict[str, List[Tuple[str, str]]]:
-        """Identify different types of clauses in the text"""
+    @timed("processor", "clauses")
+    def identify_clause_types(self, text: str, previous_text: Optional[str] = None,
+                              previous_clauses: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[Tuple[str, str]]]:
+        """Identify different types of clauses in the text
+        
+        Given a previous revision's text and clauses, paragraphs it already
+        contained keep their clause types without being scanned again.
+        """
         clauses = {}
         paragraphs = re.split(r'\n\s*\n', text)
+        known = set()
+        if previous_text is not None and previous_clauses is not None:
+            known = set(re.split(r'\n\s*\n', previous_text))
+        previous_members = {clause_type: set(paragraphs_of_type)
+                            for clause_type, paragraphs_of_type in (previous_clauses or {}).items()}
         
         for clause_type, keywords in self.clause_keywords.items():
             clauses[clause_type] = []
             
             for paragraph in paragraphs:
-                if any(keyword.lower() in paragraph.lower() for keyword in keywords):
+                if paragraph in known:
+                    matches = paragraph in previous_members.get(clause_type, ())
+                else:
+                    matches = any(keyword.lower() in paragraph.lower() for keyword in keywords)
+                if matches:
                     # Get first 50 characters as a preview
                     preview = paragraph[:50] + "..." if len(paragraph) > 50 else paragraph
                     clauses[clause_type].append((preview, paragraph))
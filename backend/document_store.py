@@ -0,0 +1,462 @@
+# backend/document_store.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from memory import deep_size
+
+# Columns holding JSON-encoded values
+JSON_FIELDS = ("entities", "clauses", "clause_summaries", "analysis")
+# Columns that make up a full document (metadata columns excluded)
+DOCUMENT_FIELDS = ("text",) + JSON_FIELDS
+# Columns kept in memory for every document
+METADATA_FIELDS = ("id", "filename", "preview", "created_at", "num_chars", "content_hash", "parent_id")
+# In-memory size categories of cached document fields
+MEMORY_CATEGORIES = {"text": "document_text", "clauses": "clause_bodies", "clause_summaries": "clause_summaries",
+                     "entities": "entity_lists", "analysis": "analysis_results"}
+# Corpus analytics kinds and their response names; parties are reported separately as a top list
+ANALYTICS_KINDS = {"clause_type": "clause_types", "entity_type": "entity_types", "risk_severity": "risk_severities"}
+
+
+def analytics_counts(document: Dict[str, Any]) -> Dict[Tuple[str, str], int]:
+    """What a document contributes to the corpus analytics: (kind, key) -> count"""
+    counts: Dict[Tuple[str, str], int] = {}
+    for clause_type, paragraphs in (document.get("clauses") or {}).items():
+        counts[("clause_type", clause_type)] = len(paragraphs)
+    for entity_type, values in (document.get("entities") or {}).items():
+        counts[("entity_type", entity_type)] = len(values)
+    for party in (document.get("entities") or {}).get("parties", []):
+        counts[("party", party)] = counts.get(("party", party), 0) + 1
+    # One risk assessment per document: the default mode's, else any other stored one
+    analysis = document.get("analysis") or {}
+    risks = analysis.get("risks")
+    if risks is None:
+        risks = next((analysis[name] for name in sorted(analysis) if name.startswith("risks_")), None)
+    for risk in risks if isinstance(risks, list) else []:
+        if isinstance(risk, dict):
+            severity = str(risk.get("severity") or "Unknown")
+            counts[("risk_severity", severity)] = counts.get(("risk_severity", severity), 0) + 1
+    return counts
+
+
+class DocumentStore:
+    """Persistent document storage backed by SQLite in WAL mode.
+
+    Keeps the dict-style access patterns of the old in-memory `documents`
+    dict. Metadata for every document stays in memory, while full text,
+    entities and clause bodies are loaded on demand into a bounded LRU.
+    Reads that don't ask for the text cache every other field, so the
+    analyses that need clauses or entities share one row load.
+
+    Every write is also appended to a change log, which other processes
+    sharing the database replay to keep their metadata and caches current.
+    """
+
+    def __init__(self, path: str, cache_size: int = 32):
+        self.path = path
+        self.cache_size = cache_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Bumped by every write, so a row read before a write is not cached after it
+        self._version = 0
+        self._metadata: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._last_change = 0
+        self._listeners: List[Callable[[str, str], None]] = []
+        self.setup_schema()
+        self._load_metadata()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """One connection per thread; FastAPI runs sync endpoints in a thread pool"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def setup_schema(self):
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    preview TEXT,
+                    created_at REAL NOT NULL,
+                    num_chars INTEGER,
+                    text TEXT,
+                    entities TEXT,
+                    clauses TEXT,
+                    clause_summaries TEXT,
+                    analysis TEXT,
+                    minhash BLOB,
+                    content_hash TEXT,
+                    parent_id TEXT
+                )
+            """)
+            # Databases created before content hashes were stored
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(documents)")}
+            if "content_hash" not in columns:
+                self.connection.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+                for document_id, text in self.connection.execute("SELECT id, text FROM documents").fetchall():
+                    self.connection.execute(
+                        "UPDATE documents SET content_hash = ? WHERE id = ?",
+                        (hashlib.sha256((text or "").encode("utf-8")).hexdigest(), document_id)
+                    )
+            # Databases created before documents could be revisions of others
+            if "parent_id" not in columns:
+                self.connection.execute("ALTER TABLE documents ADD COLUMN parent_id TEXT")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS documents_created ON documents (created_at, id)"
+            )
+            # Corpus analytics, maintained with every document write
+            analytics_exists = self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics'"
+            ).fetchone()
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS analytics (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    documents INTEGER NOT NULL,
+                    PRIMARY KEY (kind, key)
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS analytics_top ON analytics (kind, count)")
+            if not analytics_exists:
+                self._rebuild_analytics()
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document_id TEXT NOT NULL,
+                    operation TEXT NOT NULL
+                )
+            """)
+
+    def _load_metadata(self):
+        with self._lock:
+            self._last_change = self.connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM changes"
+            ).fetchone()[0]
+            rows = self.connection.execute(
+                f"SELECT {', '.join(METADATA_FIELDS)} FROM documents ORDER BY created_at, id"
+            )
+            self._metadata.clear()
+            for row in rows:
+                self._metadata[row[0]] = self._metadata_from_row(row)
+
+    def _update_analytics(self, previous: Dict[Tuple[str, str], int], current: Dict[Tuple[str, str], int]):
+        """Apply the change in a document's contribution; call inside the write transaction"""
+        deltas = []
+        for kind_key in set(previous) | set(current):
+            before, after = previous.get(kind_key, 0), current.get(kind_key, 0)
+            documents = (after > 0) - (before > 0)
+            if after != before or documents:
+                deltas.append((*kind_key, after - before, documents))
+        self.connection.executemany("""
+            INSERT INTO analytics (kind, key, count, documents) VALUES (?, ?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET
+                count = count + excluded.count, documents = documents + excluded.documents
+        """, deltas)
+        # Only keys this document stopped contributing to can have dropped to zero
+        self.connection.executemany(
+            "DELETE FROM analytics WHERE kind = ? AND key = ? AND documents <= 0",
+            [(kind, key) for kind, key, _, documents in deltas if documents < 0]
+        )
+
+    def _rebuild_analytics(self):
+        """Recompute the analytics of all stored documents, e.g. for databases that predate them"""
+        self.connection.execute("DELETE FROM analytics")
+        rows = self.connection.execute("SELECT entities, clauses, analysis FROM documents")
+        for row in rows.fetchall():
+            document = {field: json.loads(value) if value else {}
+                        for field, value in zip(("entities", "clauses", "analysis"), row)}
+            self._update_analytics({}, {**analytics_counts(document), ("corpus", "documents"): 1})
+
+    def _stored_analytics_counts(self, document_id: str) -> Dict[Tuple[str, str], int]:
+        """Current contribution of a stored document (empty if absent); call inside the write transaction"""
+        row = self.connection.execute(
+            "SELECT entities, clauses, analysis FROM documents WHERE id = ?", (document_id,)
+        ).fetchone()
+        if row is None:
+            return {}
+        document = {field: json.loads(value) if value else {}
+                    for field, value in zip(("entities", "clauses", "analysis"), row)}
+        return {**analytics_counts(document), ("corpus", "documents"): 1}
+
+    def analytics(self, top_parties: int = 10) -> Dict[str, Any]:
+        """Corpus-wide counts and document frequencies, read from the maintained aggregates"""
+        result: Dict[str, Any] = {"documents": 0, **{name: {} for name in ANALYTICS_KINDS.values()}}
+        rows = self.connection.execute(
+            f"SELECT kind, key, count, documents FROM analytics WHERE kind IN "
+            f"({', '.join('?' * (len(ANALYTICS_KINDS) + 1))})",
+            ("corpus", *ANALYTICS_KINDS)
+        )
+        for kind, key, count, documents in rows:
+            if kind == "corpus":
+                result["documents"] = count
+            else:
+                result[ANALYTICS_KINDS[kind]][key] = {"count": count, "documents": documents}
+        result["top_parties"] = [
+            {"party": key, "count": count, "documents": documents}
+            for key, count, documents in self.connection.execute(
+                "SELECT key, count, documents FROM analytics WHERE kind = 'party' "
+                "ORDER BY count DESC LIMIT ?", (top_parties,)
+            )
+        ]
+        return result
+
+    def _log_change(self, document_id: str, operation: str):
+        """Record a write; call inside the write transaction"""
+        self.connection.execute(
+            "INSERT INTO changes (document_id, operation) VALUES (?, ?)", (document_id, operation)
+        )
+
+    def add_listener(self, listener: Callable[[str, str], None]):
+        """Call `listener(operation, document_id)` for changes made by other processes"""
+        self._listeners.append(listener)
+
+    def refresh(self):
+        """Apply documents added, updated or deleted by other processes"""
+        with self._lock:
+            changes = self.connection.execute(
+                "SELECT seq, document_id, operation FROM changes WHERE seq > ? ORDER BY seq",
+                (self._last_change,)
+            ).fetchall()
+            applied = []
+            for seq, document_id, operation in changes:
+                self._last_change = seq
+                self._cache.pop(document_id, None)
+                self._version += 1
+                if operation == "add" and document_id not in self._metadata:
+                    row = self.connection.execute(
+                        f"SELECT {', '.join(METADATA_FIELDS)} FROM documents WHERE id = ?", (document_id,)
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    self._metadata[document_id] = self._metadata_from_row(row)
+                elif operation == "delete" and document_id in self._metadata:
+                    del self._metadata[document_id]
+                else:
+                    continue
+                applied.append((operation, document_id))
+        for operation, document_id in applied:
+            for listener in self._listeners:
+                listener(operation, document_id)
+
+    @staticmethod
+    def _metadata_from_row(row) -> Dict[str, Any]:
+        return dict(zip(METADATA_FIELDS, row))
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self._metadata
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._metadata))
+
+    def metadata(self, document_id: str) -> Dict[str, Any]:
+        """Lightweight, always in-memory document information"""
+        return self._metadata[document_id]
+
+    def list_metadata(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._metadata.values())
+
+    def page(self, after: Optional[tuple] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Metadata of up to `limit` documents ordered by (created_at, id), after a cursor"""
+        query = f"SELECT {', '.join(METADATA_FIELDS)} FROM documents"
+        params: tuple = ()
+        if after is not None:
+            query += " WHERE (created_at, id) > (?, ?)"
+            params = tuple(after)
+        rows = self.connection.execute(query + " ORDER BY created_at, id LIMIT ?", params + (limit,))
+        return [self._metadata_from_row(row) for row in rows]
+
+    def __getitem__(self, document_id: str) -> Dict[str, Any]:
+        """Full document, loaded from disk on a cache miss"""
+        metadata = self._metadata.get(document_id)
+        if metadata is None:
+            raise KeyError(document_id)
+        return dict(metadata, **self.get_fields(document_id, *DOCUMENT_FIELDS))
+
+    def get(self, document_id: str, default=None) -> Optional[Dict[str, Any]]:
+        try:
+            return self[document_id]
+        except KeyError:
+            return default
+
+    def get_fields(self, document_id: str, *fields: str) -> Dict[str, Any]:
+        """Load only some fields of a document, e.g. clause summaries without the text"""
+        invalid = set(fields) - set(DOCUMENT_FIELDS)
+        if invalid:
+            raise ValueError(f"Unknown document fields: {', '.join(sorted(invalid))}")
+        if not fields:
+            return {}
+        with self._lock:
+            cached = self._cache.get(document_id)
+            if cached is not None and all(field in cached for field in fields):
+                self._cache.move_to_end(document_id)
+                return {field: cached[field] for field in fields}
+            version = self._version
+
+        # The text is most of a row, so it is only loaded when asked for
+        columns = fields if "text" in fields else tuple(field for field in DOCUMENT_FIELDS if field != "text")
+        row = self.connection.execute(
+            f"SELECT {', '.join(columns)} FROM documents WHERE id = ?", (document_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(document_id)
+        loaded = {}
+        for field, value in zip(columns, row):
+            if field in JSON_FIELDS:
+                value = json.loads(value) if value else {}
+            loaded[field] = value
+
+        with self._lock:
+            if version == self._version and document_id in self._metadata:
+                document = self._cache.get(document_id)
+                if document is None:
+                    document = self._cache[document_id] = dict(self._metadata[document_id])
+                document.update(loaded)
+                self._cache.move_to_end(document_id)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return {field: loaded[field] for field in fields}
+
+    def text_range(self, document_id: str, start: int, length: Optional[int] = None,
+                   unit: str = "chars"):
+        """Slice of the document text without loading all of it into Python.
+
+        With unit="bytes" the slice is taken from the UTF-8 encoding and
+        returned as bytes along with the total byte length.
+        """
+        column = "text" if unit == "chars" else "CAST(text AS BLOB)"
+        # SQLite substr() is 1-based and needs an explicit length
+        row = self.connection.execute(
+            f"SELECT substr({column}, ?, ?), length({column}) FROM documents WHERE id = ?",
+            (start + 1, length if length is not None else 2 ** 31 - 1, document_id)
+        ).fetchone()
+        if row is None:
+            raise KeyError(document_id)
+        return row[0], row[1]
+
+    def __setitem__(self, document_id: str, document: Dict[str, Any]):
+        self.add(document_id, document)
+
+    def add(self, document_id: str, document: Dict[str, Any], minhash: Optional[bytes] = None):
+        text = document.get("text", "")
+        metadata = {
+            "id": document_id,
+            "filename": document["filename"],
+            "preview": text[:200] + "..." if len(text) > 200 else text,
+            "created_at": document.get("created_at", time.time()),
+            "num_chars": len(text),
+            "content_hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "parent_id": document.get("parent_id"),
+        }
+        with self.connection:
+            # Take the write lock first so the analytics delta is computed from the current row
+            self.connection.execute("BEGIN IMMEDIATE")
+            previous = self._stored_analytics_counts(document_id)
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO documents ({', '.join(METADATA_FIELDS)}, "
+                f"{', '.join(DOCUMENT_FIELDS)}, minhash) VALUES ({', '.join('?' * (len(METADATA_FIELDS) + len(DOCUMENT_FIELDS) + 1))})",
+                (
+                    *(metadata[field] for field in METADATA_FIELDS), text,
+                    *(json.dumps(document.get(field, {})) for field in JSON_FIELDS),
+                    minhash,
+                )
+            )
+            self._update_analytics(previous, {**analytics_counts(document), ("corpus", "documents"): 1})
+            self._log_change(document_id, "add")
+        with self._lock:
+            self._metadata[document_id] = metadata
+            self._cache.pop(document_id, None)
+            self._version += 1
+
+    def set_analysis(self, document_id: str, name: str, value: Any):
+        """Store an analysis result (summary, risks, ...) with the document"""
+        with self._lock:
+            with self.connection:
+                # Read the stored analysis under the write lock, not from the cache,
+                # so concurrent writers neither lose results nor skew the analytics
+                self.connection.execute("BEGIN IMMEDIATE")
+                row = self.connection.execute(
+                    "SELECT analysis FROM documents WHERE id = ?", (document_id,)
+                ).fetchone()
+                if row is None:
+                    raise KeyError(document_id)
+                previous = json.loads(row[0]) if row[0] else {}
+                analysis = dict(previous, **{name: value})
+                self.connection.execute(
+                    "UPDATE documents SET analysis = ? WHERE id = ?", (json.dumps(analysis), document_id)
+                )
+                self._update_analytics(analytics_counts({"analysis": previous}),
+                                       analytics_counts({"analysis": analysis}))
+                self._log_change(document_id, "update")
+            self._version += 1
+            if document_id in self._cache:
+                self._cache[document_id]["analysis"] = analysis
+
+    def __delitem__(self, document_id: str):
+        if document_id not in self._metadata:
+            raise KeyError(document_id)
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self._update_analytics(self._stored_analytics_counts(document_id), {})
+            self.connection.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            self._log_change(document_id, "delete")
+        with self._lock:
+            self._metadata.pop(document_id, None)
+            self._cache.pop(document_id, None)
+            self._version += 1
+
+    def minhash_signatures(self) -> Iterator[tuple]:
+        """(document_id, signature bytes) for rebuilding the near-duplicate index"""
+        yield from self.connection.execute("SELECT id, minhash FROM documents WHERE minhash IS NOT NULL")
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate bytes held in memory: metadata of every document, and the cached documents by field"""
+        with self._lock:
+            metadata = list(self._metadata.values())
+            cached = list(self._cache.values())
+        usage = {"document_metadata": deep_size(metadata), **{name: 0 for name in MEMORY_CATEGORIES.values()}}
+        for document in cached:
+            for field, name in MEMORY_CATEGORIES.items():
+                usage[name] += deep_size(document.get(field))
+        return usage
+
+    def cached_size(self, document_id: str) -> Optional[int]:
+        """In-memory bytes of a document if it is in the cache"""
+        with self._lock:
+            document = self._cache.get(document_id)
+        return deep_size(document) if document is not None else None
+
+    def footprints(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Stored bytes per document and field, largest documents first"""
+        sizes = [f"COALESCE(length(CAST({column} AS BLOB)), 0)" for column in DOCUMENT_FIELDS + ("minhash",)]
+        rows = self.connection.execute(
+            f"SELECT id, filename, {', '.join(sizes)} FROM documents ORDER BY {' + '.join(sizes)} DESC LIMIT ?",
+            (limit,)
+        )
+        return [
+            {"id": row[0], "filename": row[1],
+             "stored_bytes": dict(zip(DOCUMENT_FIELDS + ("minhash",), row[2:])), "total_stored_bytes": sum(row[2:])}
+            for row in rows
+        ]
+
+    def minhash(self, document_id: str) -> Optional[bytes]:
+        row = self.connection.execute("SELECT minhash FROM documents WHERE id = ?", (document_id,)).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,33 @@
+# backend/lazy_imports.py
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that is imported on first attribute access.
+
+    Once loaded, the real module's attributes are copied onto the stand-in,
+    so later lookups are ordinary attribute hits with no extra overhead.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def _load(self):
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                module = importlib.import_module(self.__name__)
+                self.__dict__.update(module.__dict__)
+                self._lazy_module = module
+        return self._lazy_module
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Defer importing a heavy dependency (numpy, ...) until it is first used"""
+    return LazyModule(name)
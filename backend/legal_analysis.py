@@ -1,142 +1,532 @@
 # In legal_analysis.py, add the proper OpenAI import and configuration
 import os
 import json
-import openai
-from dotenv import load_dotenv
-from typing import List, Dict, Any
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from rate_limiter import get_scheduler
+from metrics import REGISTRY, timed
+from tracing import in_current_trace, start_span
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Configure OpenAI API
-openai.api_key = os.getenv("OPENAI_API_KEY", "your-api-key-here")  # Replace with your actual key if needed
+_openai = None
+_openai_lock = threading.Lock()
+LLM_REQUEST_TIMEOUT = 60.0
+
+
+def get_openai():
+    """The configured OpenAI client module, imported on first use to keep startup fast"""
+    global _openai, LLM_REQUEST_TIMEOUT
+    with _openai_lock:
+        if _openai is None:
+            from dotenv import load_dotenv
+            import openai
+
+            # Load environment variables
+            load_dotenv()
+
+            # Configure OpenAI API
+            openai.api_key = os.getenv("OPENAI_API_KEY", "your-api-key-here")  # Replace with your actual key if needed
+            # Point at any OpenAI-compatible endpoint, e.g. the local mock_llm_server.py
+            openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
+            LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+            _openai = openai
+        return _openai
+
+
+# Clause types assessed in clause-targeted risk mode, most risk-prone first
+RISK_CLAUSE_TYPES = [
+    "indemnification",
+    "limitation_liability",
+    "termination",
+    "non_compete",
+    "assignment",
+    "confidentiality",
+    "warranties",
+    "payment_terms",
+    "governing_law",
+    "force_majeure",
+]
+
+SEVERITY_ORDER = {"High": 0, "Medium": 1, "Low": 2}
+
+LLM_QUEUE_WAIT = REGISTRY.histogram(
+    "legal_llm_queue_wait_seconds", "Time LLM calls waited for rate limit capacity", ("priority",)
+)
+LLM_LATENCY = REGISTRY.histogram(
+    "legal_llm_request_duration_seconds", "Duration of successful LLM calls", ("model",)
+)
+LLM_CALLS = REGISTRY.counter(
+    "legal_llm_calls_total", "LLM calls by outcome", ("model", "outcome")
+)
+LLM_ATTEMPTS = REGISTRY.counter(
+    "legal_llm_attempts_total", "LLM call attempts, including retries", ("model",)
+)
+
+
+def _retry_after(error: Exception):
+    """Return a Retry-After delay for retryable OpenAI errors, None otherwise"""
+    openai = get_openai()
+    retryable = (
+        openai.error.RateLimitError,
+        openai.error.APIError,
+        openai.error.Timeout,
+        openai.error.APIConnectionError,
+        openai.error.ServiceUnavailableError,
+        openai.error.TryAgain,
+    )
+    if not isinstance(error, retryable):
+        return None
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class LLMError(Exception):
+    """An LLM call that failed even after the scheduler's retries.
+
+    `retry_after` is the suggested delay in seconds when the failure is
+    transient (rate limiting, timeouts, outages), None when retrying won't help.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 
 class LegalAnalyzer:
-    def __init__(self):
+    def __init__(self, background: bool = False):
         self.model = "gpt-4o"  # Use a powerful model for legal analysis
+        self.background = background  # Low priority, e.g. prefetch after upload
+        self.scheduler = get_scheduler()
+        self.last_timing = {}
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token estimate (~4 characters per token)"""
+        return len(text) // 4
+
+    def _submit_chat(self, messages: List[Dict[str, str]], max_tokens: int,
+                     temperature: float) -> Tuple[Any, Dict[str, Any]]:
+        """Call the chat completion API through the shared rate limit scheduler"""
+        openai = get_openai()
+        estimated_tokens = sum(self.estimate_tokens(m["content"]) for m in messages) + max_tokens
+        with start_span("llm.chat", model=self.model, estimated_tokens=estimated_tokens,
+                        max_tokens=max_tokens, background=self.background) as span:
+            try:
+                outcome = self.scheduler.submit(
+                    lambda: openai.ChatCompletion.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        request_timeout=LLM_REQUEST_TIMEOUT
+                    ),
+                    estimated_tokens=estimated_tokens,
+                    is_retryable=_retry_after,
+                    background=self.background,
+                )
+            except Exception as e:
+                LLM_CALLS.inc(model=self.model, outcome="error")
+                logger.warning("LLM call to %s failed: %s", self.model, e)
+                raise LLMError(f"LLM call failed: {e}", _retry_after(e)) from e
+            LLM_CALLS.inc(model=self.model, outcome="success")
+            LLM_ATTEMPTS.inc(outcome["attempts"], model=self.model)
+            LLM_QUEUE_WAIT.observe(outcome["queue_wait"], priority="background" if self.background else "interactive")
+            LLM_LATENCY.observe(outcome["model_latency"], model=self.model)
+            timing = {
+                "queue_wait": round(outcome["queue_wait"], 3),
+                "model_latency": round(outcome["model_latency"], 3),
+                "attempts": outcome["attempts"],
+            }
+            if span is not None:
+                usage = outcome["result"].get("usage") or {}
+                span.set_attribute("prompt_tokens", usage.get("prompt_tokens", 0))
+                span.set_attribute("completion_tokens", usage.get("completion_tokens", 0))
+                for key, value in timing.items():
+                    span.set_attribute(key, value)
+        return outcome["result"], timing
 
+    def _chat(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float):
+        """Call the chat completion API and record its timing"""
+        response, self.last_timing = self._submit_chat(messages, max_tokens, temperature)
+        return response
+
+    @timed("analyzer", "summary")
     def generate_summary(self, text: str) -> str:
         """Generate a plain language summary of a legal document"""
         if not text:
             return "No text provided for summarization."
         
-        try:
-            prompt = f"""
-            Please provide a concise summary of the following legal text in plain language. 
-            Focus on the key obligations, rights, and important clauses.
-            
-            Text: {text[:4000]}  # Limiting input size
-            
-            Summary:
-            """
-            
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a legal expert specializing in contract analysis."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500,
-                temperature=0.3
-            )
-            
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"Error generating summary: {e}")
-            return "Error generating summary. Please try again."
+        prompt = f"""
+        Please provide a concise summary of the following legal text in plain language. 
+        Focus on the key obligations, rights, and important clauses.
+        
+        Text: {text[:4000]}  # Limiting input size
+        
+        Summary:
+        """
+        
+        response = self._chat(
+            messages=[
+                {"role": "system", "content": "You are a legal expert specializing in contract analysis."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=500,
+            temperature=0.3
+        )
+        
+        return response.choices[0].message.content.strip()
     
+    @timed("analyzer", "risks")
     def identify_risks(self, text: str) -> List[Dict[str, Any]]:
         """Identify potential risks in the legal document"""
         if not text:
             return []
         
+        prompt = f"""
+        Please analyze the following legal text and identify the top 5 potential risks or issues.
+        For each risk, provide:
+        1. A short description of the risk
+        2. The severity (High, Medium, Low)
+        3. The specific clause or text that indicates this risk
+        
+        Format your response as a JSON array with objects containing "description", "severity", and "clause".
+        
+        Text: {text[:4000]}  # Limiting input size
+        """
+        
+        response = self._chat(
+            messages=[
+                {"role": "system", "content": "You are a legal expert specializing in risk assessment."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=1000,
+            temperature=0.2
+        )
+        
+        content = response.choices[0].message.content.strip()
+        
+        # Extract JSON from the response
         try:
-            prompt = f"""
-            Please analyze the following legal text and identify the top 5 potential risks or issues.
-            For each risk, provide:
-            1. A short description of the risk
-            2. The severity (High, Medium, Low)
-            3. The specific clause or text that indicates this risk
-            
-            Format your response as a JSON array with objects containing "description", "severity", and "clause".
-            
-            Text: {text[:4000]}  # Limiting input size
-            """
-            
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a legal expert specializing in risk assessment."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.2
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-            # Extract JSON from the response
+            # Find JSON array in the response
+            start_idx = content.find('[')
+            end_idx = content.rfind(']') + 1
+            if start_idx >= 0 and end_idx > start_idx:
+                json_str = content[start_idx:end_idx]
+                risks = json.loads(json_str)
+                return risks
+            self.last_timing["parse_error"] = True
+            return []
+        except:
+            # Fallback if JSON parsing fails
+            self.last_timing["parse_error"] = True
+            return [{"description": "Error parsing risk analysis results", "severity": "Unknown", "clause": ""}]
+    
+    def build_clause_groups(self, clauses: Dict[str, List[str]],
+                            token_budget: int = 1000) -> Dict[str, List[str]]:
+        """Select deduplicated risk-relevant clause paragraphs within a token budget"""
+        seen = set()
+        candidates = {}
+        for clause_type in RISK_CLAUSE_TYPES:
+            for paragraph in clauses.get(clause_type, []):
+                # Paragraphs often match several clause types; keep the first
+                key = " ".join(paragraph.split()).lower()
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                candidates.setdefault(clause_type, []).append(paragraph.strip())
+
+        # Round-robin over clause types so every group gets some budget
+        groups = {}
+        remaining = token_budget
+        position = 0
+        while remaining > 0 and any(position < len(v) for v in candidates.values()):
+            for clause_type, paragraphs in candidates.items():
+                if position >= len(paragraphs) or remaining <= 0:
+                    continue
+                paragraph = paragraphs[position]
+                tokens = self.estimate_tokens(paragraph)
+                if tokens > remaining:
+                    paragraph = paragraph[:remaining * 4]
+                    tokens = remaining
+                groups.setdefault(clause_type, []).append(paragraph)
+                remaining -= tokens
+            position += 1
+        return groups
+
+    def _assess_clause_group(self, clause_type: str, paragraphs: List[str]):
+        """Assess the risks of one clause group"""
+        clause_text = "\n\n".join(f"[{i + 1}] {p}" for i, p in enumerate(paragraphs))
+        prompt = f"""
+        The following are {clause_type.replace('_', ' ')} clauses from a contract.
+        Identify up to 2 potential risks or issues they create.
+        For each risk, provide:
+        1. A short description of the risk
+        2. The severity (High, Medium, Low)
+        3. The specific clause or text that indicates this risk
+        
+        Format your response as a JSON array with objects containing "description", "severity", and "clause".
+        
+        Clauses:
+        {clause_text}
+        """
+        response, timing = self._submit_chat(
+            messages=[
+                {"role": "system", "content": "You are a legal expert specializing in risk assessment."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=400,
+            temperature=0.2
+        )
+        content = response.choices[0].message.content.strip()
+        start_idx = content.find('[')
+        end_idx = content.rfind(']') + 1
+        risks = []
+        if start_idx >= 0 and end_idx > start_idx:
             try:
-                # Find JSON array in the response
-                start_idx = content.find('[')
-                end_idx = content.rfind(']') + 1
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = content[start_idx:end_idx]
-                    risks = json.loads(json_str)
-                    return risks
-                return []
-            except:
-                # Fallback if JSON parsing fails
-                return [{"description": "Error parsing risk analysis results", "severity": "Unknown", "clause": ""}]
-        except Exception as e:
-            print(f"Error identifying risks: {e}")
+                risks = json.loads(content[start_idx:end_idx])
+            except ValueError:
+                logger.warning("Could not parse %s risk analysis results", clause_type)
+                timing["parse_error"] = True
+        else:
+            timing["parse_error"] = True
+        for risk in risks:
+            risk["clause_type"] = clause_type
+        return risks, timing
+
+    @timed("analyzer", "clause_risks")
+    def identify_clause_risks(self, clauses: Dict[str, List[str]],
+                              token_budget: int = 1000) -> List[Dict[str, Any]]:
+        """Identify risks from the identified clause paragraphs, one concurrent call per clause type"""
+        groups = self.build_clause_groups(clauses, token_budget)
+        if not groups:
             return []
+
+        risks = []
+        timings = []
+        errors = []
+        assess = in_current_trace(self._assess_clause_group)
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [executor.submit(assess, clause_type, paragraphs)
+                       for clause_type, paragraphs in groups.items()]
+            for future in futures:
+                try:
+                    group_risks, timing = future.result()
+                    risks.extend(group_risks)
+                    timings.append(timing)
+                except LLMError as e:
+                    errors.append(e)
+        # A partial assessment would look complete; fail like the single-call mode
+        if errors:
+            raise errors[0]
+
+        if timings:
+            self.last_timing = {
+                "queue_wait": max(t["queue_wait"] for t in timings),
+                "model_latency": max(t["model_latency"] for t in timings),
+                "attempts": sum(t["attempts"] for t in timings),
+                "calls": len(timings),
+            }
+            if any(t.get("parse_error") for t in timings):
+                self.last_timing["parse_error"] = True
+        risks.sort(key=lambda r: SEVERITY_ORDER.get(r.get("severity"), len(SEVERITY_ORDER)))
+        return risks
+    
+    def build_question_context(self, chunks: List[Dict[str, Any]],
+                               token_budget: int = 1500) -> List[Dict[str, Any]]:
+        """Select retrieved chunks, best first, until the token budget is used up"""
+        selected = []
+        seen = set()
+        remaining = token_budget
+        for chunk in chunks:
+            content = chunk["content"].strip()
+            key = " ".join(content.split()).lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            tokens = self.estimate_tokens(content)
+            if tokens > remaining:
+                if remaining < 50:
+                    break
+                content = content[:remaining * 4]
+                tokens = remaining
+            selected.append(dict(chunk, content=content))
+            remaining -= tokens
+        return selected
+
+    @timed("analyzer", "answer")
+    def answer_question(self, question: str, chunks: List[Dict[str, Any]],
+                        token_budget: int = 1500) -> Dict[str, Any]:
+        """Answer a question from retrieved document chunks, citing the chunks used"""
+        context = self.build_question_context(chunks, token_budget)
+        if not context:
+            return {"answer": "No relevant passages were found to answer this question.", "citations": []}
+
+        passages = "\n\n".join(
+            f"[{i + 1}] ({chunk['title']}) {chunk['content']}" for i, chunk in enumerate(context)
+        )
+        prompt = f"""
+        Answer the question using only the numbered passages from legal documents below.
+        If the passages do not contain the answer, say so.
+        
+        Format your response as a JSON object with "answer" (plain language) and
+        "citations" (the numbers of the passages the answer relies on).
+        
+        Question: {question}
+        
+        Passages:
+        {passages}
+        """
+        
+        response = self._chat(
+            messages=[
+                {"role": "system", "content": "You are a legal expert answering questions about contracts."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=500,
+            temperature=0.2
+        )
+        
+        content = response.choices[0].message.content.strip()
+        start_idx = content.find('{')
+        end_idx = content.rfind('}') + 1
+        try:
+            result = json.loads(content[start_idx:end_idx]) if 0 <= start_idx < end_idx else {}
+        except ValueError:
+            result = {}
+        if not isinstance(result, dict) or "answer" not in result:
+            # Not JSON: keep the text and cite every passage it was given
+            result = {"answer": content, "citations": list(range(1, len(context) + 1))}
+
+        citations = []
+        cited = set()
+        for number in result.get("citations") or []:
+            try:
+                number = int(number)
+            except (TypeError, ValueError):
+                continue
+            if not 1 <= number <= len(context) or number in cited:
+                continue
+            cited.add(number)
+            chunk = context[number - 1]
+            citations.append({
+                "number": number,
+                "document_id": chunk["document_id"],
+                "title": chunk["title"],
+                "chunk_id": chunk["chunk_id"],
+                "clause_type": chunk.get("clause_type"),
+                "score": chunk.get("score"),
+                "lexical_score": chunk.get("lexical_score"),
+                "excerpt": chunk["content"][:200]
+            })
+        return {"answer": str(result["answer"]).strip(), "citations": citations}
+    
+    @timed("analyzer", "compare_differences")
+    def compare_clause_differences(self, differences: List[Dict[str, Any]],
+                                   token_budget: int = 1500) -> Dict[str, Any]:
+        """Explain the material clause differences found by the local comparison"""
+        if not differences:
+            return {"summary": "No material differences between the documents' clauses."}
+
+        # Pack the differences into the prompt until the token budget is used up
+        sections = []
+        remaining = token_budget
+        for difference in differences:
+            label = difference["clause_type"].replace("_", " ")
+            if difference["kind"] == "changed":
+                section = (f"{label} (changed)\nText 1: {difference['doc1_clause']}\n"
+                           f"Text 2: {difference['doc2_clause']}")
+            elif difference["kind"] == "only_in_doc1":
+                section = f"{label} (only in Text 1)\nText 1: {difference['doc1_clause']}"
+            else:
+                section = f"{label} (only in Text 2)\nText 2: {difference['doc2_clause']}"
+            tokens = self.estimate_tokens(section)
+            if tokens > remaining:
+                if remaining < 50:
+                    break
+                section = section[:remaining * 4]
+                tokens = remaining
+            sections.append(section)
+            remaining -= tokens
+
+        differences_text = "\n\n".join(sections)
+        prompt = f"""
+        The following clauses differ materially between two legal texts.
+        Identify the key differences in terms of:
+        1. Obligations and rights
+        2. Important clauses like governing law, termination, etc.
+        3. Risk allocation
+        
+        Format your response as a JSON object with these categories.
+        
+        Differences:
+        {differences_text}
+        """
+        
+        response = self._chat(
+            messages=[
+                {"role": "system", "content": "You are a legal expert specializing in contract comparison."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=1000,
+            temperature=0.2
+        )
+        
+        content = response.choices[0].message.content.strip()
+        start_idx = content.find('{')
+        end_idx = content.rfind('}') + 1
+        if start_idx >= 0 and end_idx > start_idx:
+            try:
+                return json.loads(content[start_idx:end_idx])
+            except ValueError:
+                return {"error": "Error parsing comparison results"}
+        return {"error": "Could not parse comparison results"}
     
+    @timed("analyzer", "compare")
     def compare_documents(self, doc1: str, doc2: str) -> Dict[str, Any]:
         """Compare two legal documents and identify differences"""
         if not doc1 or not doc2:
             return {"error": "Two documents are required for comparison"}
         
+        prompt = f"""
+        Please compare these two legal texts and identify key differences in terms of:
+        1. Obligations and rights
+        2. Important clauses like governing law, termination, etc.
+        3. Risk allocation
+        
+        Format your response as a JSON object with these categories.
+        
+        Text 1: {doc1[:2000]}  # Limiting input size
+        
+        Text 2: {doc2[:2000]}  # Limiting input size
+        """
+        
+        response = self._chat(
+            messages=[
+                {"role": "system", "content": "You are a legal expert specializing in contract comparison."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=1000,
+            temperature=0.2
+        )
+        
+        content = response.choices[0].message.content.strip()
+        
+        # Extract JSON from the response
         try:
-            prompt = f"""
-            Please compare these two legal texts and identify key differences in terms of:
-            1. Obligations and rights
-            2. Important clauses like governing law, termination, etc.
-            3. Risk allocation
-            
-            Format your response as a JSON object with these categories.
-            
-            Text 1: {doc1[:2000]}  # Limiting input size
-            
-            Text 2: {doc2[:2000]}  # Limiting input size
-            """
-            
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a legal expert specializing in contract comparison."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.2
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-            # Extract JSON from the response
-            try:
-                # Find JSON object in the response
-                start_idx = content.find('{')
-                end_idx = content.rfind('}') + 1
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = content[start_idx:end_idx]
-                    comparison = json.loads(json_str)
-                    return comparison
-                return {"error": "Could not parse comparison results"}
-            except:
-                # Fallback if JSON parsing fails
-                return {"error": "Error parsing comparison results"}
-        except Exception as e:
-            print(f"Error comparing documents: {e}")
-            return {"error": str(e)}
\ No newline at end of file
+            # Find JSON object in the response
+            start_idx = content.find('{')
+            end_idx = content.rfind('}') + 1
+            if start_idx >= 0 and end_idx > start_idx:
+                json_str = content[start_idx:end_idx]
+                comparison = json.loads(json_str)
+                return comparison
+            return {"error": "Could not parse comparison results"}
+        except:
+            # Fallback if JSON parsing fails
+            return {"error": "Error parsing comparison results"}
\ No newline at end of file
@@ -0,0 +1,429 @@
+# backend/load_test.py
+"""Drive a mix of API requests against a backend and check latency SLOs.
+
+Two load models:
+
+- open loop (--rate):        requests arrive at a fixed rate (or as a Poisson
+                             process with --arrivals poisson) whatever the
+                             response times; latency is measured from each
+                             request's scheduled start, so queueing in the
+                             client counts against the server
+- closed loop (--concurrency): N simulated users each send a request, wait for
+                             the response and --think-time, then send the next
+
+The mix weights the operations below, e.g. --mix search=50,document=30,upload=10,ask=10:
+
+    upload     POST /upload                  (a generated contract)
+    search     POST /search
+    document   GET  /documents/{id}
+    clauses    GET  /clauses/{id}
+    summarize  POST /summarize/{id}
+    risks      POST /risk-assessment/{id}
+    ask        POST /ask
+    compare    POST /compare
+
+Reports throughput, p50/p95/p99 latency, error and shed (429/503) rates per
+endpoint as JSON. With --slo, exits with status 1 when any threshold is
+breached, so it can gate CI:
+
+    python load_test.py --url http://localhost:8000 --rate 20 --duration 60 --slo slo.json
+
+An SLO file maps endpoints (or "*" for every endpoint, "total" for all
+requests together) to thresholds in seconds, requests per second and
+fractions:
+
+    {"POST /search": {"p95": 0.25, "p99": 0.5, "error_rate": 0.01},
+     "*": {"error_rate": 0.05}, "total": {"min_throughput": 15}}
+
+--start runs the backend itself in a fresh data directory, like startup_budget.py.
+Needs the packages in requirements-dev.txt (`pip install -r requirements-dev.txt`).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from startup_budget import BACKEND_DIR, free_port, wait_for
+
+DEFAULT_MIX = "search=40,document=25,clauses=10,upload=10,ask=5,summarize=5,risks=5"
+# Thresholds understood in SLO files; "min_" thresholds are lower bounds
+SLO_METRICS = ("p50", "p95", "p99", "max", "error_rate", "shed_rate", "min_throughput")
+
+QUESTIONS = [
+    "Who must indemnify whom?",
+    "How can the agreement be terminated?",
+    "What law governs the agreement?",
+    "Is liability capped?",
+    "When are payments due?",
+]
+CLAUSES = [
+    "This Agreement shall be governed by the laws of the State of {state}.",
+    "Either party may terminate this Agreement upon {days} days written notice.",
+    "The {party} shall indemnify and hold harmless the other party from any third-party claims.",
+    "In no event shall either party's liability exceed ${amount},000.",
+    "Payment of all fees is due within {days} days of the invoice date.",
+    "Each party shall keep the other party's Confidential Information confidential.",
+    "Neither party may assign this Agreement without the other party's prior written consent.",
+    "Neither party is liable for delays caused by force majeure, including acts of God.",
+]
+
+
+def generate_contract(rng: random.Random, serial: int) -> str:
+    """A small synthetic contract; the serial number keeps every upload distinct"""
+    paragraphs = [f"MASTER SERVICES AGREEMENT No. {serial}",
+                  f"This Agreement is made on January {rng.randint(1, 28)}, 2024 between Acme Corp and Jane Doe."]
+    for _ in range(rng.randint(6, 20)):
+        paragraphs.append(rng.choice(CLAUSES).format(
+            state=rng.choice(["Texas", "Ohio", "New York", "Delaware"]), days=rng.choice([15, 30, 60, 90]),
+            party=rng.choice(["Customer", "Provider"]), amount=rng.randint(1, 500)
+        ))
+    return "\n\n".join(paragraphs)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    if not any(weight > 0 for weight in weights.values()):
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return weights
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LoadClient:
+    """Per-thread HTTP sessions plus the document ids requests can refer to"""
+
+    def __init__(self, base_url: str, timeout: float, seed: int):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.seed = seed
+        self.document_ids: List[str] = []
+        self._local = threading.local()
+        self._serial = 0
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._local.session = session
+        return session
+
+    @property
+    def rng(self) -> random.Random:
+        rng = getattr(self._local, "rng", None)
+        if rng is None:
+            rng = self._local.rng = random.Random(f"{self.seed}-{threading.get_ident()}")
+        return rng
+
+    def next_serial(self) -> int:
+        with self._lock:
+            self._serial += 1
+            return self._serial
+
+    def random_document(self) -> str:
+        return self.rng.choice(self.document_ids)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        return self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+
+    def upload(self) -> requests.Response:
+        serial = self.next_serial()
+        text = generate_contract(self.rng, serial)
+        response = self.request("POST", "/upload",
+                                files={"file": (f"load-{self.seed}-{serial}.txt", text.encode(), "text/plain")})
+        if response.status_code == 200:
+            document_id = response.json().get("document_id")
+            if document_id:
+                with self._lock:
+                    self.document_ids.append(document_id)
+        return response
+
+    def search(self):
+        return self.request("POST", "/search", data={"query": self.rng.choice(QUESTIONS)})
+
+    def document(self):
+        return self.request("GET", f"/documents/{self.random_document()}")
+
+    def clauses(self):
+        return self.request("GET", f"/clauses/{self.random_document()}")
+
+    def summarize(self):
+        return self.request("POST", f"/summarize/{self.random_document()}")
+
+    def risks(self):
+        return self.request("POST", f"/risk-assessment/{self.random_document()}")
+
+    def ask(self):
+        data = {"question": self.rng.choice(QUESTIONS)}
+        if self.rng.random() < 0.5:
+            data["document_id"] = self.random_document()
+        return self.request("POST", "/ask", data=data)
+
+    def compare(self):
+        data = {"doc1_id": self.random_document(), "doc2_id": self.random_document(), "use_llm": "false"}
+        return self.request("POST", "/compare", data=data)
+
+
+# operation: (endpoint reported, request)
+OPERATIONS: Dict[str, Tuple[str, Callable[[LoadClient], requests.Response]]] = {
+    "upload": ("POST /upload", LoadClient.upload),
+    "search": ("POST /search", LoadClient.search),
+    "document": ("GET /documents/{id}", LoadClient.document),
+    "clauses": ("GET /clauses/{id}", LoadClient.clauses),
+    "summarize": ("POST /summarize/{id}", LoadClient.summarize),
+    "risks": ("POST /risk-assessment/{id}", LoadClient.risks),
+    "ask": ("POST /ask", LoadClient.ask),
+    "compare": ("POST /compare", LoadClient.compare),
+}
+
+
+class Recorder:
+    """Collects (endpoint, status, latency) samples from all threads"""
+
+    def __init__(self, record_after: float):
+        self.record_after = record_after  # end of the warm-up, on the perf_counter clock
+        self.samples: List[Tuple[str, Optional[int], float]] = []
+        self._lock = threading.Lock()
+
+    def run(self, client: LoadClient, operation: str, scheduled: float):
+        """Send one request; latency counts from `scheduled`, the time it was due"""
+        endpoint, send = OPERATIONS[operation]
+        try:
+            status = send(client).status_code
+        except requests.RequestException:
+            status = None
+        latency = time.perf_counter() - scheduled
+        if scheduled >= self.record_after:
+            with self._lock:
+                self.samples.append((endpoint, status, latency))
+
+
+def run_open_loop(client: LoadClient, recorder: Recorder, weights: Dict[str, float], rate: float,
+                  duration: float, arrivals: str, max_in_flight: int):
+    """Dispatch requests on a fixed schedule without waiting for responses"""
+    rng = random.Random(client.seed)
+    names, cumulative = list(weights), list(weights.values())
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="load") as executor:
+        started = time.perf_counter()
+        scheduled = started
+        while scheduled < started + duration:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            operation = rng.choices(names, cumulative)[0]
+            # Requests that find every worker busy wait in the executor queue, which
+            # their latency includes, instead of silently lowering the offered rate
+            executor.submit(recorder.run, client, operation, scheduled)
+            scheduled += rng.expovariate(rate) if arrivals == "poisson" else 1 / rate
+
+
+def run_closed_loop(client: LoadClient, recorder: Recorder, weights: Dict[str, float], concurrency: int,
+                    duration: float, think_time: float):
+    """Each simulated user sends its next request once the previous one has been answered"""
+    deadline = time.perf_counter() + duration
+    names, cumulative = list(weights), list(weights.values())
+
+    def user():
+        while time.perf_counter() < deadline:
+            recorder.run(client, client.rng.choices(names, cumulative)[0], time.perf_counter())
+            if think_time:
+                time.sleep(client.rng.expovariate(1 / think_time))
+
+    threads = [threading.Thread(target=user, name=f"user-{i}", daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def summarize(samples: List[Tuple[str, Optional[int], float]], elapsed: float) -> Dict[str, Dict[str, Any]]:
+    """Per-endpoint and total throughput, latency percentiles, error and shed rates"""
+    groups = defaultdict(list)
+    for sample in samples:
+        groups[sample[0]].append(sample)
+        groups["total"].append(sample)
+
+    report = {}
+    for endpoint, group in sorted(groups.items(), key=lambda item: (item[0] == "total", item[0])):
+        latencies = sorted(latency for _, _, latency in group)
+        statuses = defaultdict(int)
+        for _, status, _ in group:
+            statuses[str(status) if status is not None else "connection_error"] += 1
+        errors = sum(count for status, count in statuses.items()
+                     if status == "connection_error" or int(status) >= 400)
+        shed = statuses.get("429", 0) + statuses.get("503", 0)
+        report[endpoint] = {
+            "requests": len(group),
+            "throughput": round(len(group) / elapsed, 3) if elapsed else None,
+            "p50": round(percentile(latencies, 0.50), 4),
+            "p95": round(percentile(latencies, 0.95), 4),
+            "p99": round(percentile(latencies, 0.99), 4),
+            "max": round(latencies[-1], 4),
+            "error_rate": round(errors / len(group), 4),
+            "shed_rate": round(shed / len(group), 4),
+            "statuses": dict(sorted(statuses.items())),
+        }
+    return report
+
+
+def check_slo(report: Dict[str, Dict[str, Any]], slo: Dict[str, Dict[str, float]]) -> List[Dict[str, Any]]:
+    """Thresholds the report breaches; endpoints with no requests breach nothing but "min_throughput" """
+    breaches = []
+    for endpoint, thresholds in slo.items():
+        if endpoint == "*":
+            targets = [name for name in report if name != "total"]
+        else:
+            targets = [endpoint]
+        for target in targets:
+            measured = report.get(target, {})
+            for metric, threshold in thresholds.items():
+                if metric not in SLO_METRICS:
+                    raise ValueError(f"Unknown SLO metric {metric!r} for {endpoint}")
+                if metric == "min_throughput":
+                    value = measured.get("throughput") or 0
+                    ok = value >= threshold
+                else:
+                    value = measured.get(metric)
+                    ok = value is None or value <= threshold
+                if not ok:
+                    breaches.append({"endpoint": target, "metric": metric, "value": value, "threshold": threshold})
+    return breaches
+
+
+def seed_documents(client: LoadClient, count: int):
+    """Upload the documents the read and analysis requests refer to"""
+    for _ in range(count):
+        response = client.upload()
+        response.raise_for_status()
+
+
+def start_backend(env) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    return server, f"http://127.0.0.1:{port}"
+
+
+def run(args, base_url: str) -> Dict[str, Any]:
+    weights = parse_mix(args.mix)
+    client = LoadClient(base_url, args.timeout, args.seed)
+    seed_documents(client, args.documents)
+
+    recorder = Recorder(time.perf_counter() + args.warmup)
+    started = time.perf_counter()
+    if args.concurrency:
+        run_closed_loop(client, recorder, weights, args.concurrency, args.warmup + args.duration, args.think_time)
+    else:
+        run_open_loop(client, recorder, weights, args.rate, args.warmup + args.duration,
+                      args.arrivals, args.max_in_flight)
+    # Late responses to the open loop's last requests count, at the throughput they were offered at
+    elapsed = max(args.duration, time.perf_counter() - started - args.warmup)
+    return {
+        "config": {
+            "mode": "closed" if args.concurrency else "open",
+            "rate": None if args.concurrency else args.rate,
+            "arrivals": None if args.concurrency else args.arrivals,
+            "concurrency": args.concurrency or None,
+            "think_time": args.think_time if args.concurrency else None,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "mix": weights,
+        },
+        "elapsed": round(elapsed, 3),
+        "endpoints": summarize(recorder.samples, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running backend")
+    target.add_argument("--start", action="store_true", help="Start the backend in a fresh data directory")
+    load = parser.add_mutually_exclusive_group(required=True)
+    load.add_argument("--rate", type=float, help="Open loop: requests per second")
+    load.add_argument("--concurrency", type=int, help="Closed loop: number of simulated users")
+    parser.add_argument("--arrivals", choices=("uniform", "poisson"), default="uniform",
+                        help="Open loop arrival process")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Open loop: client threads")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="Closed loop: mean seconds between a response and the user's next request")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of load before measuring starts")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--documents", type=int, default=20, help="Documents uploaded before the run")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--slo", help="JSON file of latency, error rate and throughput thresholds")
+    parser.add_argument("--output", help="Also write the report to this file")
+    args = parser.parse_args()
+    if (args.rate is not None and args.rate <= 0) or (args.concurrency is not None and args.concurrency <= 0):
+        parser.error("--rate and --concurrency must be positive")
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.documents < 1 and set(weights) - {"upload", "search"}:
+        parser.error("--documents must be at least 1 for operations on existing documents")
+
+    if args.start:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATA_DIR=os.path.join(tmp, "data"))
+            for name in ("DOCUMENT_DB_PATH", "INDEX_DIR", "PROFILE_DIR"):
+                env.pop(name, None)
+            server, base_url = start_backend(env)
+            try:
+                wait_for(f"{base_url}/ready", time.perf_counter(), args.timeout)
+                report = run(args, base_url)
+            finally:
+                server.terminate()
+                server.wait()
+    else:
+        report = run(args, args.url)
+
+    ok = True
+    if args.slo:
+        with open(args.slo) as f:
+            slo = json.load(f)
+        breaches = check_slo(report["endpoints"], slo)
+        report["slo"] = {"file": args.slo, "ok": not breaches, "breaches": breaches}
+        ok = not breaches
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# backend/memory.py
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Allocation groupings understood by tracemalloc
+GROUP_BY = ("lineno", "filename", "traceback")
+# Allocations made by the measuring itself
+IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>")
+
+
+def deep_size(obj: Any) -> int:
+    """Approximate bytes held by an object and everything it contains.
+
+    Follows dicts, lists, tuples and sets and counts every object once.
+    Arrays count their own buffer (sys.getsizeof includes it for arrays
+    that own their data); views count the object they were made from,
+    so memory-mapped arrays add only their headers.
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if item is None or id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif type(item).__module__ == "numpy":
+            stack.append(getattr(item, "base", None))
+    return size
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """Resident set size of this process now and at its peak, in bytes"""
+    rss = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"rss_bytes": rss, "peak_rss_bytes": peak if sys.platform == "darwin" else peak * 1024}
+
+
+def _location(stat, group_by: str):
+    if group_by == "traceback":
+        return [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    frame = stat.traceback[0]
+    return frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}"
+
+
+class SnapshotStore:
+    """tracemalloc control plus the most recent snapshots, kept in memory for diffing"""
+
+    def __init__(self, keep: int = 5):
+        self.keep = keep
+        self._snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        """Stop tracing and drop the snapshots, releasing tracemalloc's own memory"""
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+
+    def status(self) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_bytes": traced,
+            "peak_traced_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        }
+
+    def take(self) -> str:
+        """Take a snapshot and keep it; returns its id"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing")
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, filename) for filename in IGNORED_FILES]
+        )
+        snapshot_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._snapshots[snapshot_id] = {"snapshot": snapshot, "taken_at": time.time()}
+            while len(self._snapshots) > self.keep:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def get(self, snapshot_id: str) -> Optional[tracemalloc.Snapshot]:
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        return entry["snapshot"] if entry else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._snapshots.items())
+        return [{"id": snapshot_id, "taken_at": entry["taken_at"]} for snapshot_id, entry in reversed(entries)]
+
+    @staticmethod
+    def top(snapshot: tracemalloc.Snapshot, group_by: str = "lineno", limit: int = 20) -> List[Dict[str, Any]]:
+        """Largest allocation sites of a snapshot"""
+        return [
+            {"location": _location(stat, group_by), "size": stat.size, "count": stat.count}
+            for stat in snapshot.statistics(group_by)[:limit]
+        ]
+
+    @staticmethod
+    def compare(snapshot: tracemalloc.Snapshot, previous: tracemalloc.Snapshot,
+                group_by: str = "lineno", limit: int = 20) -> List[Dict[str, Any]]:
+        """Allocation sites that grew (or shrank) the most since a previous snapshot"""
+        return [
+            {"location": _location(stat, group_by), "size": stat.size, "size_diff": stat.size_diff,
+             "count": stat.count, "count_diff": stat.count_diff}
+            for stat in snapshot.compare_to(previous, group_by)[:limit]
+        ]
@@ -0,0 +1,205 @@
+# backend/mock_llm_server.py
+"""Local OpenAI-compatible chat completions stand-in for load tests and offline CI.
+
+Point the backend at it with OPENAI_API_BASE=http://localhost:8100/v1 and run:
+
+    python mock_llm_server.py --port 8100 --latency lognormal:-0.5,0.4 --rate-limit-rate 0.05
+
+Every option can also be set through the matching MOCK_LLM_* environment variable.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock OpenAI Chat Completions")
+
+
+class MockSettings:
+    def __init__(self):
+        self.latency = os.getenv("MOCK_LLM_LATENCY", "fixed:0.2")
+        self.rate_limit_rate = float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0"))
+        self.retry_after = float(os.getenv("MOCK_LLM_RETRY_AFTER", "1"))
+        self.timeout_rate = float(os.getenv("MOCK_LLM_TIMEOUT_RATE", "0"))
+        self.timeout_seconds = float(os.getenv("MOCK_LLM_TIMEOUT_SECONDS", "120"))
+        self.tokens_per_second = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "50"))
+        self.random = random.Random(int(os.getenv("MOCK_LLM_SEED", "0")))
+
+    def sample_latency(self) -> float:
+        """Draw a latency from the configured distribution (fixed, uniform or lognormal)"""
+        kind, _, params = self.latency.partition(":")
+        values = [float(v) for v in params.split(",") if v]
+        if kind == "fixed":
+            return values[0] if values else 0.0
+        if kind == "uniform":
+            return self.random.uniform(values[0], values[1])
+        if kind == "lognormal":
+            return self.random.lognormvariate(values[0], values[1])
+        raise ValueError(f"Unknown latency distribution: {self.latency}")
+
+
+settings = MockSettings()
+stats = Counter()
+
+
+def _digest(text: str) -> int:
+    return int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+
+
+def canned_response(messages: List[Dict[str, str]]) -> str:
+    """Deterministic response templated on the kind of analysis requested"""
+    system = messages[0]["content"].lower() if messages else ""
+    prompt = messages[-1]["content"] if messages else ""
+    severity = ["High", "Medium", "Low"][_digest(prompt) % 3]
+    if "risk" in system:
+        return json.dumps([
+            {
+                "description": "Broad indemnification obligations without a cap",
+                "severity": severity,
+                "clause": prompt.strip()[:80],
+            },
+            {
+                "description": "Termination rights are unclear",
+                "severity": "Medium",
+                "clause": "",
+            },
+        ])
+    if "question" in system:
+        return json.dumps({
+            "answer": f"The passages address this question. (mock answer {_digest(prompt):08x})",
+            "citations": [1],
+        })
+    if "comparison" in system:
+        return json.dumps({
+            "obligations_and_rights": ["The documents allocate obligations differently."],
+            "important_clauses": ["Termination and liability terms differ."],
+            "risk_allocation": [f"Comparison fingerprint {_digest(prompt):08x}."],
+        })
+    return (f"This agreement sets out the parties' key obligations and rights. "
+            f"(mock summary {_digest(prompt):08x} of {len(prompt)} characters)")
+
+
+def _completion(model: str, content: str, prompt_tokens: int) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+        },
+    }
+
+
+async def _stream(model: str, content: str):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    words = content.split(" ")
+    delay = 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+    for i, word in enumerate(words):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": {"content": word if i == 0 else " " + word},
+                "finish_reason": None,
+            }],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(delay)
+    final = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+    }
+    yield f"data: {json.dumps(final)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "mock")
+    stats["requests"] += 1
+
+    roll = settings.random.random()
+    if roll < settings.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(settings.retry_after)},
+            content={"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+        )
+    if roll < settings.rate_limit_rate + settings.timeout_rate:
+        stats["timed_out"] += 1
+        await asyncio.sleep(settings.timeout_seconds)
+
+    await asyncio.sleep(settings.sample_latency())
+    content = canned_response(messages)
+    stats["completed"] += 1
+    if body.get("stream"):
+        return StreamingResponse(_stream(model, content), media_type="text/event-stream")
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+    return _completion(model, content, prompt_tokens)
+
+
+@app.get("/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "gpt-4o", "object": "model", "owned_by": "mock"}]}
+
+
+@app.get("/stats")
+def get_stats():
+    """Request counts, e.g. to check how many calls caching and coalescing saved"""
+    return dict(stats)
+
+
+@app.post("/stats/reset")
+def reset_stats():
+    stats.clear()
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", help="fixed:SECONDS, uniform:LOW,HIGH or lognormal:MU,SIGMA")
+    parser.add_argument("--rate-limit-rate", type=float, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--timeout-rate", type=float, help="Fraction of requests that hang")
+    parser.add_argument("--timeout-seconds", type=float, help="How long hanging requests hang")
+    parser.add_argument("--tokens-per-second", type=float, help="Streaming speed")
+    parser.add_argument("--seed", type=int, help="Seed for latency and failure injection")
+    args = parser.parse_args()
+
+    for name in ("latency", "rate_limit_rate", "retry_after", "timeout_rate", "timeout_seconds", "tokens_per_second"):
+        value = getattr(args, name)
+        if value is not None:
+            setattr(settings, name, value)
+    if args.seed is not None:
+        settings.random.seed(args.seed)
+
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,152 @@
+# backend/near_duplicates.py
+import re
+import threading
+import zlib
+from typing import Dict, List, Any, Optional
+from lazy_imports import lazy_import
+from memory import deep_size
+
+np = lazy_import("numpy")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+class MinHashLSH:
+    """MinHash signatures over word shingles with a banded LSH index.
+
+    Documents whose shingle sets have Jaccard similarity s collide in at
+    least one band with probability 1 - (1 - s^r)^b, so near-duplicates are
+    found by looking at a handful of buckets instead of every document.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self._permutations = None
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(bands)]
+        self.signatures: "Dict[str, np.ndarray]" = {}
+        self._lock = threading.Lock()
+
+    def permutations(self):
+        """Hash permutation coefficients (a, b), generated on first use"""
+        if self._permutations is None:
+            rng = np.random.RandomState(self.seed)
+            a = rng.randint(1, (1 << 32) - 1, size=self.num_perm, dtype=np.uint64)
+            b = rng.randint(0, (1 << 32) - 1, size=self.num_perm, dtype=np.uint64)
+            self._permutations = (a, b)
+        return self._permutations
+
+    def shingles(self, text: str) -> set:
+        """Hashed word n-grams of the normalized text"""
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < self.shingle_size:
+            return {zlib.crc32(" ".join(words).encode())} if words else set()
+        return {
+            zlib.crc32(" ".join(words[i:i + self.shingle_size]).encode())
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> "Optional[np.ndarray]":
+        """MinHash signature of a text, or None if it has no words"""
+        hashes = np.fromiter(self.shingles(text), dtype=np.uint64)
+        if not len(hashes):
+            return None
+        a, b = self.permutations()
+        prime, max_hash = np.uint64(_MERSENNE_PRIME), np.uint64(_MAX_HASH)
+        signature = np.full(self.num_perm, max_hash, dtype=np.uint64)
+        # Batch the shingles to bound the (shingles x permutations) matrix
+        for start in range(0, len(hashes), 4096):
+            batch = hashes[start:start + 4096, np.newaxis]
+            permuted = ((batch * a + b) % prime) & max_hash
+            signature = np.minimum(signature, permuted.min(axis=0))
+        return signature.astype(np.uint32)
+
+    def _band_keys(self, signature: "np.ndarray") -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, document_id: str, signature: "Optional[np.ndarray]"):
+        if signature is None:
+            return
+        with self._lock:
+            self.signatures[document_id] = signature
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                band.setdefault(key, set()).add(document_id)
+
+    def remove(self, document_id: str):
+        with self._lock:
+            signature = self.signatures.pop(document_id, None)
+            if signature is None:
+                return
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                members = band.get(key)
+                if members is not None:
+                    members.discard(document_id)
+                    if not members:
+                        del band[key]
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate bytes held by signatures and LSH buckets"""
+        with self._lock:
+            return {"near_duplicate_signatures": deep_size(self.signatures),
+                    "near_duplicate_buckets": deep_size(self._buckets)}
+
+    @staticmethod
+    def similarity(a: "np.ndarray", b: "np.ndarray") -> float:
+        """Estimated Jaccard similarity of two signatures"""
+        return float(np.mean(a == b))
+
+    def _candidates(self, signature: "np.ndarray") -> set:
+        candidates = set()
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(band.get(key, ()))
+        return candidates
+
+    def query(self, document_id: str, threshold: float = 0.5, limit: int = 10) -> List[Dict[str, Any]]:
+        """Near-duplicates of an indexed document, most similar first"""
+        with self._lock:
+            signature = self.signatures.get(document_id)
+            if signature is None:
+                return []
+            results = []
+            for candidate in self._candidates(signature) - {document_id}:
+                score = self.similarity(signature, self.signatures[candidate])
+                if score >= threshold:
+                    results.append({"document_id": candidate, "similarity": round(score, 3)})
+        results.sort(key=lambda r: r["similarity"], reverse=True)
+        return results[:limit]
+
+    def clusters(self, threshold: float = 0.8) -> List[List[str]]:
+        """Group indexed documents into near-duplicate clusters"""
+        with self._lock:
+            parent = {doc_id: doc_id for doc_id in self.signatures}
+
+            def find(doc_id):
+                while parent[doc_id] != doc_id:
+                    parent[doc_id] = parent[parent[doc_id]]
+                    doc_id = parent[doc_id]
+                return doc_id
+
+            checked = set()
+            for band in self._buckets:
+                for members in band.values():
+                    if len(members) < 2:
+                        continue
+                    members = sorted(members)
+                    for i, a in enumerate(members):
+                        for b in members[i + 1:]:
+                            if (a, b) in checked:
+                                continue
+                            checked.add((a, b))
+                            if self.similarity(self.signatures[a], self.signatures[b]) >= threshold:
+                                parent[find(a)] = find(b)
+
+            groups = {}
+            for doc_id in parent:
+                groups.setdefault(find(doc_id), []).append(doc_id)
+        return sorted((g for g in groups.values() if len(g) > 1), key=len, reverse=True)
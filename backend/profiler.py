@@ -0,0 +1,193 @@
+# backend/profiler.py
+import contextvars
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Frames of threads parked waiting for work rather than doing any
+_WAIT_FILES = ("threading.py", "queue.py")
+_IDLE_FRAMES = {("selectors.py", None), ("thread.py", "_worker"), ("_asyncio.py", "run")}
+
+
+def _is_idle(frame) -> bool:
+    """Whether a thread is an idle pool worker or event loop waiting for work"""
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _WAIT_FILES:
+            return (filename, None) in _IDLE_FRAMES or (filename, frame.f_code.co_name) in _IDLE_FRAMES
+        frame = frame.f_back
+    return True
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # No semicolons: they separate frames in the collapsed stack format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for the threads serving one request.
+
+    A background thread snapshots the stacks of the tracked threads every
+    `interval` seconds, so time spent waiting (rate limits, locks, network)
+    shows up as well as CPU time. When no thread was tracked, every busy
+    thread of the process is sampled.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.threads = set()
+        self.samples = 0
+        self.started = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track_thread(self, ident: Optional[int] = None):
+        self.threads.add(ident if ident is not None else threading.get_ident())
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.time() - self.started
+
+    def _stack(self, frame) -> tuple:
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        return tuple(reversed(labels))
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            threads = set(self.threads)
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if threads and ident not in threads:
+                    continue
+                # Tracked threads keep their waits; they are part of the request's latency
+                if not threads and _is_idle(frame):
+                    continue
+                self.stacks[self._stack(frame)] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Collapsed stacks, one `root;...;leaf count` line each, for flamegraph.pl or speedscope"""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common())
+
+    def report(self, limit: int = 25) -> Dict[str, Any]:
+        """Hottest functions by self time (leaf of the stack) and total time (anywhere on it)"""
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            if not stack:
+                continue
+            self_counts[stack[-1]] += count
+            for label in set(stack):
+                total_counts[label] += count
+        stack_samples = sum(self.stacks.values()) or 1
+        # Sleeps overshoot the interval, so measure the real time per sample
+        period = self.duration / self.samples if self.samples else self.interval
+
+        def rows(counts):
+            return [
+                {"function": label, "samples": count, "percent": round(100.0 * count / stack_samples, 1),
+                 "seconds": round(count * period, 3)}
+                for label, count in counts.most_common(limit)
+            ]
+
+        return {
+            "started": self.started,
+            "duration": round(self.duration, 3),
+            "interval": self.interval,
+            "samples": self.samples,
+            "threads": len(self.threads),
+            "self": rows(self_counts),
+            "total": rows(total_counts),
+        }
+
+
+# Profiler of the request being handled, if it is being profiled
+_current_profiler: contextvars.ContextVar = contextvars.ContextVar("current_profiler", default=None)
+
+
+def activate(profiler: SamplingProfiler):
+    """Make `profiler` the profiler of the current request context"""
+    return _current_profiler.set(profiler)
+
+
+def deactivate(token):
+    _current_profiler.reset(token)
+
+
+def track_current_thread():
+    """Let the active profiler sample the thread running this code"""
+    profiler = _current_profiler.get()
+    if profiler is not None:
+        profiler.track_thread()
+
+
+class ProfileStore:
+    """Saved request profiles on disk, so any worker can serve them"""
+
+    def __init__(self, directory: str, keep: int = 50):
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, profile_id: str, profile: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{profile_id}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(profile, f)
+        os.replace(path + ".tmp", path)
+        for old_path in self._paths()[self.keep:]:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+    def _paths(self) -> List[str]:
+        """Profile files, newest first"""
+        def modified(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+
+        paths = glob.glob(os.path.join(self.directory, "*.json"))
+        return sorted(paths, key=modified, reverse=True)
+
+    def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        if os.path.basename(profile_id) != profile_id:
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        summaries = []
+        for path in self._paths():
+            try:
+                with open(path) as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summaries.append({key: profile[key] for key in ("id", "method", "path", "status", "duration", "trigger")})
+        return summaries
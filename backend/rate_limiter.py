@@ -0,0 +1,165 @@
+# backend/rate_limiter.py
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Continuously refilling budget, e.g. requests or tokens per minute"""
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if available now)"""
+        # Requests larger than the whole bucket are allowed once it is full
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def take(self, amount: float):
+        self.available -= min(amount, self.capacity)
+
+
+class RetryableError(Exception):
+    """Raised by scheduled calls that should be retried after a delay"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitScheduler:
+    """Shared scheduler for LLM calls.
+
+    Calls wait in a FIFO queue until both the requests/min and tokens/min
+    budgets allow them, and retryable failures are retried with jittered
+    exponential backoff (honoring Retry-After when the provider sends it).
+    Background calls queue behind interactive ones and only run while at
+    least `background_reserve` of each budget is left for interactive use.
+    """
+
+    def __init__(self, requests_per_minute: int = 60, tokens_per_minute: int = 90000,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 background_reserve: float = 0.5):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.background_reserve = background_reserve
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = 0
+        self._blocked_until = 0.0
+
+    def _acquire(self, tokens: int, background: bool = False) -> float:
+        """Block until the call may proceed; returns the time spent waiting"""
+        start = time.monotonic()
+        with self._cond:
+            self._sequence += 1
+            ticket = (1 if background else 0, self._sequence)
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.requests.refill(now)
+                    self.tokens.refill(now)
+                    if min(self._queue) == ticket:
+                        reserve = self.background_reserve if background else 0.0
+                        wait = max(self.requests.wait_time(1 + reserve * self.requests.capacity),
+                                   self.tokens.wait_time(tokens + reserve * self.tokens.capacity),
+                                   self._blocked_until - now)
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            return time.monotonic() - start
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter: uniform between 0 and the exponential cap
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def submit(self, fn: Callable[[], Any], estimated_tokens: int = 0,
+               is_retryable: Callable[[Exception], Optional[float]] = None,
+               background: bool = False) -> Dict[str, Any]:
+        """Run `fn` under the rate limits.
+
+        `is_retryable` returns None for errors that should be raised
+        immediately, or a Retry-After delay in seconds (0 for "use backoff").
+        Returns the result along with queue wait, model latency and attempts.
+        """
+        queue_wait = 0.0
+        attempt = 0
+        while True:
+            with start_span("rate_limiter.wait", tokens=estimated_tokens, background=background) as span:
+                waited = self._acquire(estimated_tokens, background)
+                if span is not None:
+                    span.set_attribute("wait_seconds", round(waited, 3))
+            queue_wait += waited
+            started = time.monotonic()
+            try:
+                with start_span("llm.attempt", attempt=attempt + 1):
+                    result = fn()
+                return {
+                    "result": result,
+                    "queue_wait": queue_wait,
+                    "model_latency": time.monotonic() - started,
+                    "attempts": attempt + 1,
+                }
+            except Exception as e:
+                retry_after = is_retryable(e) if is_retryable else None
+                if retry_after is None and isinstance(e, RetryableError):
+                    retry_after = e.retry_after or 0
+                if retry_after is None or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, retry_after or None)
+                logger.warning("Retrying LLM call in %.1fs after error: %s", delay, e)
+                attempt += 1
+                if retry_after:
+                    # The provider told us to back off; hold the whole queue
+                    with self._cond:
+                        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                        self._cond.notify_all()
+                backoff_start = time.monotonic()
+                with start_span("rate_limiter.backoff", delay=round(delay, 3), retry_after=bool(retry_after)):
+                    time.sleep(delay)
+                queue_wait += time.monotonic() - backoff_start
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RateLimitScheduler:
+    """Process-wide scheduler configured from the environment"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler(
+                requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+                tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "90000")),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+            )
+        return _scheduler
@@ -0,0 +1,113 @@
+# backend/startup_budget.py
+"""Measure cold-start time of the backend and check it against a budget.
+
+Runs the app in fresh processes and reports:
+
+- import:        seconds to `import app`
+- listening:     seconds from process start until GET /health answers
+- ready:         seconds from process start until GET /ready returns 200
+- first_request: latency of the first POST /search after readiness
+
+Exits with status 1 when any measurement exceeds its budget, so it can gate CI:
+
+    python startup_budget.py --import-budget 0.6 --ready-budget 5 --first-request-budget 0.5
+
+Needs the packages in requirements-dev.txt (`pip install -r requirements-dev.txt`).
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import(env, runs: int) -> float:
+    """Median seconds to import the app module in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, started: float, timeout: float) -> float:
+    """Seconds since `started` until `url` returns 200"""
+    while time.perf_counter() - started < timeout:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def measure_server(env, timeout: float) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    try:
+        listening = wait_for(f"{base_url}/health", started, timeout)
+        ready = wait_for(f"{base_url}/ready", started, timeout)
+        request_started = time.perf_counter()
+        requests.post(f"{base_url}/search", data={"query": "termination for convenience"}, timeout=timeout)
+        first_request = time.perf_counter() - request_started
+        return {"listening": listening, "ready": ready, "first_request": first_request}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", help="Existing data directory to start from (copied; default: empty)")
+    parser.add_argument("--runs", type=int, default=3, help="Import time runs (median is reported)")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--import-budget", type=float, default=0.6)
+    parser.add_argument("--ready-budget", type=float, default=5.0)
+    parser.add_argument("--first-request-budget", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "data")
+        if args.data_dir:
+            shutil.copytree(args.data_dir, data_dir)
+        env = dict(os.environ, DATA_DIR=data_dir)
+        for name in ("DOCUMENT_DB_PATH", "INDEX_DIR", "PROFILE_DIR"):
+            env.pop(name, None)
+
+        results = {"import": measure_import(env, args.runs)}
+        results.update(measure_server(env, args.timeout))
+
+    budgets = {"import": args.import_budget, "ready": args.ready_budget,
+               "first_request": args.first_request_budget}
+    report = {name: {"seconds": round(value, 3), "budget": budgets.get(name),
+                     "ok": name not in budgets or value <= budgets[name]}
+              for name, value in results.items()}
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(entry["ok"] for entry in report.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# backend/tracing.py
+import contextvars
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "legal-document-api")
+# Spans are only recorded when a trace file is configured
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None, kind: str = "SPAN_KIND_INTERNAL"):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self.error = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error
+            else {"code": "STATUS_CODE_OK"},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class JsonLinesExporter:
+    """Writes each finished trace as one OTLP/JSON `resourceSpans` line.
+
+    The file can be read by the OpenTelemetry Collector's otlpjsonfile
+    receiver, or analysed directly with jq.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        record = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "legal-document-api"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            # One write per trace keeps lines whole across worker processes
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+_exporter = JsonLinesExporter(TRACE_FILE) if TRACE_FILE else None
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+# Finished spans per trace, exported when the trace's local root span ends
+_pending: Dict[str, List[Span]] = {}
+_pending_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return _exporter is not None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def current_traceparent() -> Optional[str]:
+    """W3C traceparent of the current span, to continue the trace from work that outlives it"""
+    span = _current_span.get()
+    return span.traceparent if span is not None else None
+
+
+def in_current_trace(fn):
+    """Wrap `fn` so that, run on another thread, its spans are children of the current span.
+
+    Executor threads do not inherit context variables. Only for work that
+    finishes before the current span does; otherwise pass
+    current_traceparent() and start a new local root span with it.
+    """
+    span = _current_span.get()
+
+    def run(*args, **kwargs):
+        token = _current_span.set(span)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return run
+
+
+def set_attribute(key: str, value: Any):
+    """Set an attribute on the current span, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_span_id) from a W3C traceparent header, or (None, None)"""
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+@contextmanager
+def start_span(name: str, traceparent: Optional[str] = None, kind: str = "SPAN_KIND_INTERNAL", **attributes):
+    """Run a block as a span, a child of the current span or a new (or propagated) trace"""
+    if _exporter is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_span_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_span_id = parse_traceparent(traceparent)
+        trace_id = trace_id or secrets.token_hex(16)
+    span = Span(name, trace_id, parent_span_id, attributes, kind)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end_time = time.time_ns()
+        _current_span.reset(token)
+        _finish(span, is_root=parent is None)
+
+
+def _finish(span: Span, is_root: bool):
+    with _pending_lock:
+        spans = _pending.setdefault(span.trace_id, [])
+        spans.append(span)
+        if not is_root:
+            return
+        del _pending[span.trace_id]
+    try:
+        _exporter.export(spans)
+    except OSError as e:
+        print(f"Error exporting trace {span.trace_id}: {e}")
@@ -1,19 +1,106 @@
 # backend/vector_store.py
-import numpy as np
-from typing import List, Dict, Any, Optional
+import fcntl
+import json
+import math
+import mmap
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+from metrics import stage
+from memory import deep_size
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+EMBEDDING_DIM = 384
+ROW_BYTES = EMBEDDING_DIM * 4  # float32
+TOKEN_PATTERN = re.compile(r"\w+")
+# Left out of lexical re-ranking: frequent words a question adds nothing with
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its may must of on or shall
+should that the their there this to under was were what when where which who whom why will with would
+""".split())
+# Terms are compared by their first letters, a crude stem ("terminate" matches "termination")
+STEM_LENGTH = 6
+
+
+class Segment:
+    """A batch of chunk embeddings with their metadata, shared by many documents"""
+
+    def __init__(self, embeddings: "np.ndarray", metadata: List[list], contents=None, content_map=None):
+        self.embeddings = embeddings  # normalized float32, one row per chunk
+        self.metadata = metadata  # [document_id, chunk_id, title, clause_type, start, end]
+        self._contents = contents  # in-memory chunk texts
+        self._content_map = content_map  # memory-mapped UTF-8 chunk texts
+        # A document's rows are contiguous: they are appended, and compacted, together
+        self.ranges: Dict[str, Tuple[int, int]] = {}
+        for row, meta in enumerate(metadata):
+            first = self.ranges.get(meta[0], (row, row))[0]
+            self.ranges[meta[0]] = (first, row + 1)
+
+    @property
+    def rows(self) -> int:
+        return len(self.metadata)
+
+    @property
+    def text_bytes(self) -> int:
+        return self.metadata[-1][5] if self.metadata else 0
+
+    def content(self, row: int) -> str:
+        if self._contents is not None:
+            return self._contents[row]
+        start, end = self.metadata[row][4], self.metadata[row][5]
+        return self._content_map[start:end].decode("utf-8")
+
+    def block(self, document_id: str):
+        """A document's embeddings, metadata and chunk texts"""
+        start, end = self.ranges[document_id]
+        return self.embeddings[start:end], self.metadata[start:end], [self.content(row) for row in range(start, end)]
+
+
+def _segment_name(entry) -> str:
+    return entry if isinstance(entry, str) else entry["name"]
+
 
 class VectorStore:
-    def __init__(self):
-        self.documents = []  # Store documents in memory
-    
+    """Chunk embedding index.
+
+    Documents are appended to a shared segment until it holds `segment_rows`
+    chunks, then a new segment is started. Without a data directory the
+    segments live in memory. With one, each segment is a set of append-only
+    files (raw embeddings .f32, metadata .jsonl, chunk text .txt) whose
+    committed sizes are listed in manifest.json. Readers memory-map the
+    committed part and pick up appends when the manifest changes, so several
+    worker processes can share the index. Writes are serialized across
+    processes with a file lock.
+
+    Deleted documents are tombstoned; once `compact_ratio` of a segment's
+    rows are deleted, compaction rewrites its live rows and drops it.
+    """
+
+    def __init__(self, data_dir: Optional[str] = None, segment_rows: int = 8192, compact_ratio: float = 0.25):
+        self.data_dir = data_dir
+        self.segment_rows = segment_rows
+        self.compact_ratio = compact_ratio
+        self.segments: Dict[str, Segment] = {}
+        self.deleted = set()
+        self._lock = threading.Lock()
+        self._manifest_version = None
+        self._next_segment = 0  # names of in-memory segments
+        if data_dir:
+            # Segments are loaded by refresh(), e.g. during the startup warm-up
+            os.makedirs(data_dir, exist_ok=True)
+
     def connect(self):
         """Dummy connect method"""
         print("Using in-memory vector storage")
-    
+
     def setup_schema(self):
         """Dummy schema setup"""
         pass
-    
+
     def embed_text(self, text: str) -> List[float]:
         """Generate a simple embedding for text"""
         # Simple embedding method that uses character frequencies
@@ -23,60 +110,426 @@ class VectorStore:
             val = sum([(ord(c) * (i + 1)) % 256 for c in text]) / 256.0
             embedding.append(val)
         return embedding
-    
-    def add_document(self, document_id: str, title: str, chunks: List[str], 
-                    clause_types: Optional[List[str]] = None) -> bool:
-        """Add document chunks to the vector store"""
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.data_dir, "manifest.json")
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {"next_segment": 0, "segments": [], "deleted": []}
+        manifest.setdefault("deleted", [])
+        return manifest
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        # Atomic replace so readers never see a partial manifest
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path)
+
+    @contextmanager
+    def _writer_lock(self):
+        """Single writer across all worker processes"""
+        with open(os.path.join(self.data_dir, "index.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_segment(self, entry) -> Segment:
+        if isinstance(entry, str):
+            # One immutable segment per document, as written by earlier versions
+            base = os.path.join(self.data_dir, entry)
+            embeddings = np.load(base + ".npy", mmap_mode="r")
+            with open(base + ".json") as f:
+                metadata = json.load(f)
+            with open(base + ".txt", "rb") as f:
+                content_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+            return Segment(embeddings, metadata, content_map=content_map)
+
+        # Only the committed part; a writer may be appending past it
+        base = os.path.join(self.data_dir, entry["name"])
+        if entry["rows"]:
+            embeddings = np.memmap(base + ".f32", dtype=np.float32, mode="r", shape=(entry["rows"], EMBEDDING_DIM))
+        else:
+            embeddings = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        with open(base + ".jsonl", "rb") as f:
+            metadata = [json.loads(line) for line in f.read(entry["metadata_bytes"]).splitlines()]
+        with open(base + ".txt", "rb") as f:
+            content_map = mmap.mmap(f.fileno(), entry["text_bytes"], access=mmap.ACCESS_READ) if entry["text_bytes"] else b""
+        return Segment(embeddings, metadata, content_map=content_map)
+
+    def _load_manifest(self, version):
+        with self._lock:
+            manifest = self._read_manifest()
+            segments = {}
+            for entry in manifest["segments"]:
+                name = _segment_name(entry)
+                segment = self.segments.get(name)
+                # The last segment grows as documents are appended to it
+                if segment is None or (not isinstance(entry, str) and segment.rows != entry["rows"]):
+                    segment = self._load_segment(entry)
+                segments[name] = segment
+            self.segments = segments
+            self.deleted = set(manifest["deleted"])
+            self._manifest_version = version
+
+    def refresh(self):
+        """Pick up segments written by other processes"""
+        if not self.data_dir:
+            return
+        for _ in range(3):
+            try:
+                stat = os.stat(self._manifest_path)
+            except FileNotFoundError:
+                return
+            # The manifest is replaced atomically, so a new inode means a new version
+            version = (stat.st_ino, stat.st_mtime_ns)
+            if version == self._manifest_version:
+                return
+            try:
+                self._load_manifest(version)
+                return
+            except FileNotFoundError:
+                # Compaction removed segments listed in the manifest we read; read the new one
+                continue
+
+    def document_chunks(self, document_id: str) -> List[Dict[str, Any]]:
+        """A document's chunks in order, with their normalized embeddings and clause types"""
+        self.refresh()
+        with self._lock:
+            if document_id in self.deleted:
+                return []
+            segments = [segment for segment in self.segments.values() if document_id in segment.ranges]
+        chunks = []
+        for segment in segments:
+            start, end = segment.ranges[document_id]
+            for row in range(start, end):
+                _, chunk_id, _, clause_type = segment.metadata[row][:4]
+                chunks.append({
+                    "chunk_id": chunk_id,
+                    "content": segment.content(row),
+                    "embedding": np.array(segment.embeddings[row]),
+                    "clause_type": clause_type
+                })
+        chunks.sort(key=lambda chunk: chunk["chunk_id"])
+        return chunks
+
+    def _embed_chunks(self, chunks: List[str], reuse: Optional[Dict[str, "np.ndarray"]] = None) -> "np.ndarray":
+        embeddings = np.zeros((len(chunks), EMBEDDING_DIM), dtype=np.float32)
+        for i, chunk in enumerate(chunks):
+            if reuse and chunk in reuse:
+                # Embeddings depend only on the chunk text
+                embeddings[i] = reuse[chunk]
+            else:
+                embedding = np.asarray(self.embed_text(chunk), dtype=np.float32)
+                norm = np.linalg.norm(embedding)
+                embeddings[i] = embedding / norm if norm else embedding
+        return embeddings
+
+    @staticmethod
+    def _with_offsets(metadata: List[list], contents: List[str], offset: int) -> List[list]:
+        """Metadata rows pointing at the chunk texts' places in a segment's text, from `offset` on"""
+        rows = []
+        for meta, content in zip(metadata, contents):
+            size = len(content.encode("utf-8"))
+            rows.append(list(meta[:4]) + [offset, offset + size])
+            offset += size
+        return rows
+
+    def _append_memory(self, embeddings: "np.ndarray", metadata: List[list], contents: List[str]):
+        """Append rows to the last in-memory segment, or a new one when it is full (caller holds the lock)"""
+        name, segment = next(reversed(self.segments.items()), (None, None))
+        if segment is None or (segment.rows and segment.rows + len(metadata) > self.segment_rows):
+            name, segment = f"seg-{self._next_segment:08d}", None
+            self._next_segment += 1
+        metadata = self._with_offsets(metadata, contents, segment.text_bytes if segment else 0)
+        if segment is not None:
+            # A new Segment, so searches already holding the old one are unaffected
+            embeddings = np.concatenate([segment.embeddings, embeddings])
+            metadata = segment.metadata + metadata
+            contents = segment._contents + list(contents)
+        self.segments[name] = Segment(embeddings, metadata, contents=list(contents))
+
+    def _append_disk(self, manifest: Dict[str, Any], embeddings: "np.ndarray", metadata: List[list],
+                     contents: List[str]):
+        """Append rows to the last segment's files, or a new segment's when it is full (caller holds the writer lock).
+
+        Updates `manifest`; the rows become visible once the caller writes it.
+        """
+        entry = manifest["segments"][-1] if manifest["segments"] else None
+        if entry is None or isinstance(entry, str) or (entry["rows"] and entry["rows"] + len(metadata) > self.segment_rows):
+            entry = {"name": f"seg-{manifest['next_segment']:08d}", "rows": 0, "metadata_bytes": 0, "text_bytes": 0}
+            manifest["next_segment"] += 1
+            manifest["segments"].append(entry)
+        metadata = self._with_offsets(metadata, contents, entry["text_bytes"])
+        lines = "".join(json.dumps(row) + "\n" for row in metadata).encode("utf-8")
+        text = "".join(contents).encode("utf-8")
+        base = os.path.join(self.data_dir, entry["name"])
+        for suffix, committed, data in (
+            (".f32", entry["rows"] * ROW_BYTES, np.ascontiguousarray(embeddings, dtype=np.float32).tobytes()),
+            (".jsonl", entry["metadata_bytes"], lines),
+            (".txt", entry["text_bytes"], text),
+        ):
+            with open(base + suffix, "ab") as f:
+                # Drop anything a failed writer left past the committed end
+                f.truncate(committed)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        entry["rows"] += len(metadata)
+        entry["metadata_bytes"] += len(lines)
+        entry["text_bytes"] += len(text)
+
+    def add_document(self, document_id: str, title: str, chunks: List[str],
+                    clause_types: Optional[List[str]] = None,
+                    reuse: Optional[Dict[str, "np.ndarray"]] = None) -> bool:
+        """Add document chunks to the vector store
+
+        `reuse` maps chunk texts to embeddings already computed for them,
+        e.g. for the unchanged chunks of a previous revision.
+        """
         if not clause_types:
             clause_types = [None] * len(chunks)
-        
+        if not chunks:
+            return True
+
         try:
-            for i, chunk in enumerate(chunks):
-                embedding = self.embed_text(chunk)
-                document = {
-                    "content": chunk,
-                    "document_id": document_id,
-                    "chunk_id": i,
-                    "title": title,
-                    "embedding": embedding,
-                    "clause_type": clause_types[i] if i < len(clause_types) else None
-                }
-                self.documents.append(document)
+            with stage("vector_store", "embedding"):
+                embeddings = self._embed_chunks(chunks, reuse)
+            metadata = [[document_id, i, title, clause_types[i] if i < len(clause_types) else None]
+                        for i in range(len(chunks))]
+            if not self.data_dir:
+                with self._lock:
+                    self._append_memory(embeddings, metadata, chunks)
+                return True
+
+            with stage("vector_store", "indexing"), self._writer_lock():
+                manifest = self._read_manifest()
+                self._append_disk(manifest, embeddings, metadata, chunks)
+                self._write_manifest(manifest)
+            self.refresh()
             return True
         except Exception as e:
             print(f"Error adding document to vector store: {e}")
             return False
-    
-    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant document chunks using cosine similarity"""
-        if not self.documents:
+
+    def delete_document(self, document_id: str) -> bool:
+        """Remove a document from search results.
+
+        The document is tombstoned (on disk in the manifest's "deleted" list,
+        which every process reads on refresh) until compaction drops its rows.
+        """
+        try:
+            if not self.data_dir:
+                with self._lock:
+                    self.deleted.add(document_id)
+            else:
+                with self._writer_lock():
+                    manifest = self._read_manifest()
+                    if document_id not in manifest["deleted"]:
+                        manifest["deleted"].append(document_id)
+                        self._write_manifest(manifest)
+                self.refresh()
+            self.compact()
+            return True
+        except Exception as e:
+            print(f"Error deleting document from vector store: {e}")
+            return False
+
+    def _needs_compaction(self, entry, segment: Segment, deleted: set) -> bool:
+        if isinstance(entry, str):
+            # Fold per-document segments of earlier versions into shared ones
+            return True
+        dead = sum(end - start for document_id, (start, end) in segment.ranges.items() if document_id in deleted)
+        return bool(dead) and dead >= self.compact_ratio * segment.rows
+
+    def compact(self) -> int:
+        """Rewrite the live rows of segments with too many deleted rows; returns the number of segments dropped"""
+        with stage("vector_store", "compaction"):
+            if not self.data_dir:
+                with self._lock:
+                    targets = [name for name, segment in self.segments.items()
+                               if self._needs_compaction(None, segment, self.deleted)]
+                    rewritten = [self.segments.pop(name) for name in targets]
+                    for segment in rewritten:
+                        for document_id in segment.ranges:
+                            if document_id not in self.deleted:
+                                self._append_memory(*segment.block(document_id))
+                    self.deleted = {document_id for document_id in self.deleted
+                                    if any(document_id in segment.ranges for segment in self.segments.values())}
+                return len(targets)
+
+            with self._writer_lock():
+                self.refresh()
+                manifest = self._read_manifest()
+                deleted = set(manifest["deleted"])
+                targets = {_segment_name(entry) for entry in manifest["segments"]
+                           if self._needs_compaction(entry, self.segments[_segment_name(entry)], deleted)}
+                if not targets:
+                    return 0
+                manifest["segments"] = [entry for entry in manifest["segments"] if _segment_name(entry) not in targets]
+                kept = [self.segments[_segment_name(entry)] for entry in manifest["segments"]]
+                for name in sorted(targets):
+                    segment = self.segments[name]
+                    for document_id in segment.ranges:
+                        if document_id not in deleted:
+                            self._append_disk(manifest, *segment.block(document_id))
+                # Rewritten rows are all live; tombstones only matter for rows still in kept segments
+                manifest["deleted"] = [document_id for document_id in manifest["deleted"]
+                                       if any(document_id in segment.ranges for segment in kept)]
+                self._write_manifest(manifest)
+                # Readers that still map the old files keep them until they refresh
+                for name in targets:
+                    for suffix in (".npy", ".json", ".f32", ".jsonl", ".txt"):
+                        try:
+                            os.remove(os.path.join(self.data_dir, name + suffix))
+                        except FileNotFoundError:
+                            pass
+            self.refresh()
+            return len(targets)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate bytes held by the index; memory-mapped data is paged in by the OS on demand"""
+        with self._lock:
+            segments = list(self.segments.values())
+        usage = {"embeddings": 0, "embeddings_mapped": 0, "chunk_metadata": 0, "chunk_text": 0, "chunk_text_mapped": 0}
+        for segment in segments:
+            if isinstance(segment.embeddings, np.memmap):
+                usage["embeddings_mapped"] += segment.embeddings.nbytes
+            else:
+                usage["embeddings"] += segment.embeddings.nbytes
+            usage["chunk_metadata"] += deep_size(segment.metadata)
+            if segment._contents is not None:
+                usage["chunk_text"] += deep_size(segment._contents)
+            else:
+                usage["chunk_text_mapped"] += len(segment._content_map)
+        return usage
+
+    def document_footprints(self) -> Dict[str, Dict[str, int]]:
+        """Chunks, embedding bytes and chunk text bytes of each indexed document"""
+        with self._lock:
+            segments = list(self.segments.values())
+            deleted = set(self.deleted)
+        footprints: Dict[str, Dict[str, int]] = {}
+        for segment in segments:
+            for document_id, (start, end) in segment.ranges.items():
+                if document_id in deleted:
+                    continue
+                footprint = footprints.setdefault(document_id, {"chunks": 0, "embedding_bytes": 0, "chunk_text_bytes": 0})
+                footprint["chunks"] += end - start
+                footprint["embedding_bytes"] += (end - start) * ROW_BYTES
+                footprint["chunk_text_bytes"] += segment.metadata[end - 1][5] - segment.metadata[start][4]
+        return footprints
+
+    def __len__(self) -> int:
+        with self._lock:
+            segments = list(self.segments.values())
+            deleted = set(self.deleted)
+        return sum(end - start for segment in segments
+                   for document_id, (start, end) in segment.ranges.items() if document_id not in deleted)
+
+    def search(self, query: str, limit: int = 5, document_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Search for relevant document chunks using cosine similarity, optionally within one document"""
+        self.refresh()
+        with self._lock:
+            segments = list(self.segments.values())
+            deleted = set(self.deleted)
+        if not segments or (document_id is not None and document_id in deleted):
             return []
-            
+
         try:
-            query_embedding = self.embed_text(query)
-            
-            # Calculate cosine similarity with all documents
-            results = []
-            for doc in self.documents:
-                embedding = doc["embedding"]
-                # Cosine similarity calculation
-                similarity = np.dot(query_embedding, embedding) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(embedding)
-                )
-                results.append((doc, similarity))
-            
+            with stage("vector_store", "query_embedding"):
+                query_embedding = np.asarray(self.embed_text(query), dtype=np.float32)
+                norm = np.linalg.norm(query_embedding)
+                if norm:
+                    query_embedding /= norm
+
+            # Cosine similarity with all chunks (embeddings are pre-normalized), one product per segment
+            candidates = []
+            with stage("vector_store", "scoring"):
+                for segment in segments:
+                    if document_id is not None:
+                        if document_id not in segment.ranges:
+                            continue
+                        first, last = segment.ranges[document_id]
+                        scores = np.asarray(segment.embeddings[first:last] @ query_embedding)
+                    else:
+                        if not segment.rows:
+                            continue
+                        first = 0
+                        scores = np.array(segment.embeddings @ query_embedding)
+                        for dead in deleted.intersection(segment.ranges):
+                            start, end = segment.ranges[dead]
+                            scores[start:end] = -np.inf
+                    k = min(limit, len(scores))
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    candidates.extend((float(scores[row]), segment, first + int(row))
+                                      for row in top if scores[row] > -np.inf)
+
             # Sort by similarity and get top results
-            results.sort(key=lambda x: x[1], reverse=True)
-            top_results = results[:limit]
-            
-            # Format results
-            return [{
-                "content": doc["content"],
-                "document_id": doc["document_id"],
-                "title": doc["title"],
-                "chunk_id": doc["chunk_id"],
-                "clause_type": doc["clause_type"] if "clause_type" in doc else None
-            } for doc, _ in top_results]
+            candidates.sort(key=lambda x: x[0], reverse=True)
+            results = []
+            for score, segment, row in candidates[:limit]:
+                chunk_document_id, chunk_id, title, clause_type = segment.metadata[row][:4]
+                results.append({
+                    "content": segment.content(row),
+                    "document_id": chunk_document_id,
+                    "title": title,
+                    "chunk_id": chunk_id,
+                    "clause_type": clause_type,
+                    "score": round(score, 4)
+                })
+            return results
         except Exception as e:
             print(f"Error searching in vector store: {e}")
-            return []
\ No newline at end of file
+            return []
+
+
+def _stem(token: str) -> Optional[str]:
+    token = token.lower()
+    return None if token in STOPWORDS else token[:STEM_LENGTH]
+
+
+def rerank_lexical(query: str, chunks: List[Dict[str, Any]], limit: int,
+                   k1: float = 1.2, b: float = 0.75) -> List[Dict[str, Any]]:
+    """The best `limit` of the chunks by BM25 against the query, as `lexical_score`.
+
+    Any query term counts, and term rarity is measured within the given chunks.
+    Vector similarity breaks ties, so chunks sharing no term with the query
+    come last, in their original order.
+    """
+    terms = {_stem(token) for token in TOKEN_PATTERN.findall(query)} - {None}
+    if not chunks or not terms:
+        return chunks[:limit]
+
+    counts = []
+    for chunk in chunks:
+        tokens = TOKEN_PATTERN.findall(chunk["content"])
+        frequencies = {}
+        for token in tokens:
+            term = _stem(token)
+            if term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+        counts.append((len(tokens), frequencies))
+    average_length = sum(length for length, _ in counts) / len(counts) or 1
+    document_frequency = {term: sum(1 for _, frequencies in counts if term in frequencies) for term in terms}
+
+    ranked = []
+    for position, (chunk, (length, frequencies)) in enumerate(zip(chunks, counts)):
+        norm = k1 * (1 - b + b * length / average_length)
+        score = 0.0
+        for term, tf in frequencies.items():
+            df = document_frequency[term]
+            idf = math.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + norm)
+        ranked.append((-score, position, dict(chunk, lexical_score=round(score, 4))))
+    ranked.sort(key=lambda item: item[:2])
+    return [chunk for _, _, chunk in ranked[:limit]]
@@ -3,13 +3,19 @@ import streamlit as st
 import requests
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Load environment variables
 load_dotenv()
 
 # API URL
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "10"))
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "30"))
 
 # Page configuration
 st.set_page_config(
@@ -26,101 +32,137 @@ if 'selected_document' not in st.session_state:
 if 'tab' not in st.session_state:
     st.session_state.tab = "upload"
 
+class APIError(Exception):
+    """A failed backend call; the message is shown to the user"""
+
+# One keep-alive connection pool to the backend, shared by all sessions and fetch threads
+@st.cache_resource
+def get_http():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def get_fetch_executor():
+    return ThreadPoolExecutor(max_workers=API_POOL_SIZE, thread_name_prefix="api")
+
+def call_api(method, path, error, **kwargs):
+    """Call the backend over the pooled session; raises APIError unless it answers 200"""
+    try:
+        response = get_http().request(method, f"{API_URL}{path}", **kwargs)
+    except requests.RequestException as e:
+        raise APIError(f"Error connecting to API: {e}")
+    if response.status_code != 200:
+        raise APIError(f"{error}: {response.text}")
+    return response
+
+def fetch_parallel(*calls):
+    """Run independent fetches, given as (function, *args), concurrently.
+    
+    Returns their results in order; a failed fetch yields its APIError
+    instead of raising, so the caller can show it in place.
+    """
+    ctx = get_script_run_ctx()
+    
+    def run(function, *args):
+        # Cached functions look up the session's runtime through the script context
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            return function(*args)
+        except APIError as e:
+            return e
+    
+    futures = [get_fetch_executor().submit(run, *call) for call in calls]
+    return [future.result() for future in futures]
+
+def shown(result, default):
+    """The result of a fetch, or the default after showing its error"""
+    if isinstance(result, APIError):
+        st.error(str(result))
+        return default
+    return result
+
+# List and detail responses are cached for API_CACHE_TTL seconds and cleared after an upload
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def fetch_documents():
+    documents = []
+    params = {"limit": 500}
+    # The list is paginated; follow the cursor until the last page
+    while True:
+        response = call_api("GET", "/documents", "Error fetching documents", params=params)
+        documents.extend(response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            return documents
+        params["cursor"] = next_cursor
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def fetch_document_details(doc_id):
+    # Clauses are fetched separately, in parallel
+    return call_api("GET", f"/documents/{doc_id}", "Error fetching document details",
+                    params={"fields": "id,filename,text,entities"}).json()
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def fetch_document_clauses(doc_id):
+    return call_api("GET", f"/clauses/{doc_id}", "Error fetching document clauses").json()
+
+def clear_api_cache():
+    fetch_documents.clear()
+    fetch_document_details.clear()
+    fetch_document_clauses.clear()
+
 # Function to fetch documents from API
 def get_documents():
     try:
-        response = requests.get(f"{API_URL}/documents")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Error fetching documents: {response.text}")
-            return []
-    except Exception as e:
-        st.error(f"Error connecting to API: {e}")
+        return fetch_documents()
+    except APIError as e:
+        st.error(str(e))
         return []
 
 # Function to upload document
-def upload_document(file):
+def upload_document(file, parent_id=None):
     try:
         files = {"file": (file.name, file.getvalue(), file.type)}
-        response = requests.post(f"{API_URL}/upload", files=files)
-        if response.status_code == 200:
-            st.session_state.uploaded_documents = get_documents()
-            return response.json()
-        else:
-            st.error(f"Error uploading document: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"Error connecting to API: {e}")
-        return None
-
-# Function to get document details
-def get_document_details(doc_id):
-    try:
-        response = requests.get(f"{API_URL}/documents/{doc_id}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Error fetching document details: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"Error connecting to API: {e}")
+        data = {"parent_id": parent_id} if parent_id else None
+        response = call_api("POST", "/upload", "Error uploading document", files=files, data=data)
+    except APIError as e:
+        st.error(str(e))
         return None
+    clear_api_cache()
+    st.session_state.uploaded_documents = get_documents()
+    return response.json()
 
-# Function to get document clauses
-def get_document_clauses(doc_id):
-    try:
-        response = requests.get(f"{API_URL}/clauses/{doc_id}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Error fetching document clauses: {response.text}")
-            return {}
-    except Exception as e:
-        st.error(f"Error connecting to API: {e}")
-        return {}
+# Function to get document details and clauses in one parallel round trip
+def get_document_view(doc_id):
+    details, clauses = fetch_parallel((fetch_document_details, doc_id), (fetch_document_clauses, doc_id))
+    return shown(details, None), shown(clauses, {})
 
 # Function to generate document summary
 def summarize_document(doc_id):
     try:
-        response = requests.post(f"{API_URL}/summarize/{doc_id}")
-        if response.status_code == 200:
-            return response.json()["summary"]
-        else:
-            st.error(f"Error generating summary: {response.text}")
-            return "Error generating summary"
-    except Exception as e:
-        st.error(f"Error connecting to API: {e}")
-        return "Error connecting to API"
+        return call_api("POST", f"/summarize/{doc_id}", "Error generating summary").json()["summary"]
+    except APIError as e:
+        st.error(str(e))
+        return "Error generating summary"
 
 # Function to assess document risks
 def assess_document_risks(doc_id):
     try:
-        response = requests.post(f"{API_URL}/risk-assessment/{doc_id}")
-        if response.status_code == 200:
-            return response.json()["risks"]
-        else:
-            st.error(f"Error assessing risks: {response.text}")
-            return []
-    except Exception as e:
-        st.error(f"Error connecting to API: {e}")
+        return call_api("POST", f"/risk-assessment/{doc_id}", "Error assessing risks").json()["risks"]
+    except APIError as e:
+        st.error(str(e))
         return []
 
 # Function to compare documents
 def compare_documents(doc1_id, doc2_id):
     try:
-        response = requests.post(
-            f"{API_URL}/compare",
-            data={"doc1_id": doc1_id, "doc2_id": doc2_id}
-        )
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Error comparing documents: {response.text}")
-            return {"error": "Error comparing documents"}
-    except Exception as e:
-        st.error(f"Error connecting to API: {e}")
-        return {"error": f"Error connecting to API: {e}"}
+        return call_api("POST", "/compare", "Error comparing documents",
+                        data={"doc1_id": doc1_id, "doc2_id": doc2_id}).json()
+    except APIError as e:
+        st.error(str(e))
+        return {"error": str(e)}
 
 # Header
 st.title("⚖️ Legal Document Analyzer")
@@ -134,8 +176,16 @@ tab = st.sidebar.radio(
 )
 st.session_state.tab = tab.lower().replace(" ", "_")
 
-# Load documents
-if st.session_state.tab != "upload_document":
+# Load documents, together with the open document's details and clauses when viewing one
+if st.session_state.tab == "view_documents" and st.session_state.selected_document:
+    # Warms the caches the document view reads from, in the same round trip as the list
+    documents, _, _ = fetch_parallel(
+        (fetch_documents,),
+        (fetch_document_details, st.session_state.selected_document),
+        (fetch_document_clauses, st.session_state.selected_document)
+    )
+    st.session_state.uploaded_documents = shown(documents, [])
+elif st.session_state.tab != "upload_document":
     st.session_state.uploaded_documents = get_documents()
 
 # Upload Document Tab
@@ -149,9 +199,15 @@ if st.session_state.tab == "upload_document":
         st.write(f"- Type: {uploaded_file.type}")
         st.write(f"- Size: {round(len(uploaded_file.getvalue()) / 1024, 2)} KB")
         
+        # Revisions only reprocess what changed since the previous version
+        documents = get_documents()
+        parent_options = {None: "None (new document)", **{doc["id"]: doc["filename"] for doc in documents}}
+        parent_id = st.selectbox("Revision of", options=list(parent_options.keys()),
+                                 format_func=lambda x: parent_options[x])
+        
         if st.button("Process Document"):
             with st.spinner("Processing document..."):
-                result = upload_document(uploaded_file)
+                result = upload_document(uploaded_file, parent_id)
                 if result:
                     st.success("Document uploaded and processed successfully!")
                     st.json(result)
@@ -174,7 +230,7 @@ elif st.session_state.tab == "view_documents":
         
         with col2:
             if st.session_state.selected_document:
-                doc_details = get_document_details(st.session_state.selected_document)
+                doc_details, clauses = get_document_view(st.session_state.selected_document)
                 if doc_details:
                     st.subheader(f"Document: {doc_details['filename']}")
                     
@@ -197,7 +253,6 @@ elif st.session_state.tab == "view_documents":
                     # Clauses Tab
                     with doc_tabs[2]:
                         st.subheader("Identified Clauses")
-                        clauses = doc_details["clauses"]
                         if clauses:
                             for clause_type, clause_texts in clauses.items():
                                 if clause_texts:
@@ -260,9 +315,11 @@ elif st.session_state.tab == "compare_documents":
         if st.button("Compare Documents"):
             with st.spinner("Comparing documents..."):
                 comparison = compare_documents(doc1_id, doc2_id)
-                if "error" not in comparison:
+                analysis = comparison.get("analysis", {})
+                if "error" not in comparison and "error" not in analysis:
                     st.subheader("Comparison Results")
-                    for category, details in comparison.items():
+                    st.metric("Unchanged clauses", f"{comparison.get('similarity', 0):.0%}")
+                    for category, details in analysis.items():
                         with st.expander(category.replace("_", " ").title()):
                             if isinstance(details, list):
                                 for item in details:
@@ -272,8 +329,19 @@ elif st.session_state.tab == "compare_documents":
                                     st.write(f"**{key}:** {value}")
                             else:
                                 st.write(details)
+                    
+                    differences = comparison.get("material_differences", [])
+                    if differences:
+                        with st.expander(f"Clause Differences ({len(differences)})"):
+                            for difference in differences:
+                                st.markdown(f"**{difference['clause_type'].replace('_', ' ').title()}** ({difference['kind'].replace('_', ' ')})")
+                                for change in difference.get("changes", []):
+                                    st.markdown(f"- ~~{change['removed']}~~ → {change['added']}")
+                                if difference["kind"] != "changed":
+                                    st.write(difference.get("doc1_clause") or difference.get("doc2_clause"))
+                                st.markdown("---")
                 else:
-                    st.error(comparison["error"])
+                    st.error(comparison.get("error") or analysis["error"])
 
 # Search Tab
 elif st.session_state.tab == "search":
@@ -284,7 +352,7 @@ elif st.session_state.tab == "search":
     if query and st.button("Search"):
         with st.spinner("Searching..."):
             try:
-                response = requests.post(f"{API_URL}/search", data={"query": query})
+                response = get_http().post(f"{API_URL}/search", data={"query": query})
                 if response.status_code == 200:
                     results = response.json()
                     if results:
@@ -0,0 +1,148 @@
+import bisect
+import html
+import math
+import re
+from typing import Dict, List, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Query syntax: "quoted phrase", prefix*, or plain term
+QUERY_PATTERN = re.compile(r'"([^"]+)"|(\w+)\*|(\w+)')
+MAX_PREFIX_EXPANSIONS = 50
+
+
+class DocumentIndex:
+    """Positional inverted index of one document.
+
+    Maps each lowercased term to the token positions where it occurs, and
+    each token position to its character span in the original text, so
+    term, phrase and prefix queries cost the size of the postings rather
+    than a scan of the text.
+    """
+
+    def __init__(self, text: str):
+        self.postings: Dict[str, List[int]] = {}
+        self.spans: List[Tuple[int, int]] = []
+        for position, match in enumerate(TOKEN_PATTERN.finditer(text)):
+            self.postings.setdefault(match.group().lower(), []).append(position)
+            self.spans.append(match.span())
+        self.vocabulary = sorted(self.postings)
+        self.length = len(self.spans)
+
+    def term(self, term: str) -> List[Tuple[int, int]]:
+        """(first, last) token positions of each occurrence"""
+        return [(p, p) for p in self.postings.get(term, [])]
+
+    def prefix(self, prefix: str) -> List[Tuple[int, int]]:
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        matches = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            matches.extend(self.term(term))
+        return sorted(matches)
+
+    def phrase(self, terms: List[str]) -> List[Tuple[int, int]]:
+        """Occurrences of consecutive terms"""
+        if not terms:
+            return []
+        postings = [self.postings.get(term) for term in terms]
+        if not all(postings):
+            return []
+        # Walk the rarest term's postings and check the others by offset
+        anchor = min(range(len(terms)), key=lambda i: len(postings[i]))
+        others = [(i - anchor, set(p)) for i, p in enumerate(postings) if i != anchor]
+        return [
+            (p - anchor, p - anchor + len(terms) - 1)
+            for p in postings[anchor]
+            if all(p + offset in positions for offset, positions in others)
+        ]
+
+    def char_span(self, first: int, last: int) -> Tuple[int, int]:
+        return self.spans[first][0], self.spans[last][1]
+
+
+def parse_query(query: str) -> List[Tuple[str, object]]:
+    """Split a query into ("phrase", [terms]), ("prefix", str) and ("term", str) parts"""
+    parts = []
+    for phrase, prefix, term in QUERY_PATTERN.findall(query):
+        if phrase:
+            terms = [t.lower() for t in TOKEN_PATTERN.findall(phrase)]
+            if len(terms) == 1:
+                parts.append(("term", terms[0]))
+            elif terms:
+                parts.append(("phrase", terms))
+        elif prefix:
+            parts.append(("prefix", prefix.lower()))
+        else:
+            parts.append(("term", term.lower()))
+    return parts
+
+
+def _matches(index: DocumentIndex, kind: str, value) -> List[Tuple[int, int]]:
+    if kind == "phrase":
+        return index.phrase(value)
+    if kind == "prefix":
+        return index.prefix(value)
+    return index.term(value)
+
+
+def search(indexes: Dict[str, DocumentIndex], query: str, k1: float = 1.2, b: float = 0.75) -> List[Dict]:
+    """Documents matching every part of the query, ranked by BM25.
+
+    Each result has the document id, its score and the character spans of
+    all hits, sorted by position.
+    """
+    parts = parse_query(query)
+    if not parts or not indexes:
+        return []
+
+    matches = {doc_id: [_matches(index, kind, value) for kind, value in parts]
+               for doc_id, index in indexes.items()}
+    num_docs = len(indexes)
+    average_length = sum(index.length for index in indexes.values()) / num_docs or 1
+    document_frequency = [sum(1 for doc_matches in matches.values() if doc_matches[i]) for i in range(len(parts))]
+
+    results = []
+    for doc_id, doc_matches in matches.items():
+        if not all(doc_matches):
+            continue
+        index = indexes[doc_id]
+        norm = k1 * (1 - b + b * index.length / average_length)
+        score = 0.0
+        for part_matches, df in zip(doc_matches, document_frequency):
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            tf = len(part_matches)
+            score += idf * tf * (k1 + 1) / (tf + norm)
+        hits = sorted({index.char_span(first, last) for part_matches in doc_matches for first, last in part_matches})
+        results.append({"doc_id": doc_id, "score": score, "hits": hits})
+
+    results.sort(key=lambda result: result["score"], reverse=True)
+    return results
+
+
+def snippets(text: str, hits: List[Tuple[int, int]], context: int = 100, limit: int = 3) -> List[str]:
+    """HTML-escaped snippets around the hits, with every hit inside them wrapped in <mark>"""
+    windows = []
+    for start, end in hits:
+        if windows and start - context <= windows[-1][1]:
+            windows[-1][1] = min(len(text), end + context)
+            windows[-1][2].append((start, end))
+        elif len(windows) < limit:
+            windows.append([max(0, start - context), min(len(text), end + context), [(start, end)]])
+        else:
+            break
+
+    result = []
+    for window_start, window_end, window_hits in windows:
+        parts = ["..." if window_start > 0 else ""]
+        cursor = window_start
+        for start, end in window_hits:
+            if start < cursor:
+                continue
+            parts.append(html.escape(text[cursor:start]))
+            parts.append(f"<mark>{html.escape(text[start:end])}</mark>")
+            cursor = end
+        parts.append(html.escape(text[cursor:window_end]))
+        parts.append("..." if window_end < len(text) else "")
+        result.append("".join(parts))
+    return result
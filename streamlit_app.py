@@ -3,8 +3,18 @@ import os
 import io
 import pandas as pd
 import base64
+import difflib
+import hashlib
+import threading
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image
 import PyPDF2
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from search_index import DocumentIndex, search, snippets
+from text_store import TextStore
 
 # Configure secrets first - before any other Streamlit commands
 if "OPENAI_API_KEY" in st.secrets:
@@ -168,19 +178,45 @@ if 'analysis_results' not in st.session_state:
 if 'comparison_docs' not in st.session_state:
     st.session_state.comparison_docs = []
 
-# PDF text extraction function
-def extract_text_from_pdf(pdf_bytes):
-    """Extract text from a PDF file"""
-    try:
-        pdf_file = io.BytesIO(pdf_bytes)
-        reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        st.error(f"Error extracting text from PDF: {e}")
-        return ""
+# Extraction and analysis results are cached across sessions, keyed by content hash,
+# so reruns and repeat uploads of the same contract skip the work
+ANALYSIS_CACHE_ENTRIES = int(os.getenv("ANALYSIS_CACHE_ENTRIES", "64"))
+
+def content_hash(data):
+    """SHA-256 of file bytes or text, used as the cache key"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+# Document texts are kept once per server process; sessions only hold handles to them
+@st.cache_resource
+def get_text_store():
+    return TextStore(compress=os.getenv("TEXT_STORE_COMPRESS", "true").lower() in ("1", "true", "yes"))
+
+def stored_text(doc):
+    """Full text of a session document from the shared text store"""
+    return doc["text"].text
+
+def _read_pdf_text(pdf_bytes):
+    pdf_file = io.BytesIO(pdf_bytes)
+    reader = PyPDF2.PdfReader(pdf_file)
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text() + "\n"
+    return text
+
+def pdf_text(pdf_bytes, pdf_hash=None):
+    """Text of a PDF, reused from the text store while any session holds it (stored under the PDF's hash)"""
+    handle = get_text_store().find(pdf_hash or content_hash(pdf_bytes))
+    return handle.text if handle is not None else _read_pdf_text(pdf_bytes)
+
+# Arguments starting with an underscore are not hashed by Streamlit; the hash argument is the key
+@st.cache_data(max_entries=ANALYSIS_CACHE_ENTRIES, show_spinner=False)
+def _cached_pdf_preview(pdf_hash, _pdf_bytes, length=1000):
+    # Only the start is kept, so reruns of the upload page don't re-extract the PDF
+    # and full texts live in the text store alone
+    text = pdf_text(_pdf_bytes, pdf_hash)
+    return text[:length] + "..." if len(text) > length else text
 
 # Function to extract legal entities (simplified)
 def extract_legal_entities(text):
@@ -234,15 +270,22 @@ def identify_clauses(text):
     }
     
     clauses = {}
-    paragraphs = re.split(r'\n\s*\n', text)
+    # Paragraph spans; clauses refer to the text by offsets instead of holding copies
+    paragraphs = []
+    start = 0
+    for separator in re.finditer(r'\n\s*\n', text):
+        paragraphs.append((start, separator.start()))
+        start = separator.end()
+    paragraphs.append((start, len(text)))
     
     for clause_type, keywords in clause_keywords.items():
         clauses[clause_type] = []
         
-        for paragraph in paragraphs:
+        for start, end in paragraphs:
+            paragraph = text[start:end]
             if any(keyword.lower() in paragraph.lower() for keyword in keywords):
                 preview = paragraph[:50] + "..." if len(paragraph) > 50 else paragraph
-                clauses[clause_type].append((preview, paragraph))
+                clauses[clause_type].append((preview, start, end))
     
     return clauses
 
@@ -289,6 +332,61 @@ def assess_risks(clauses):
     
     return risks
 
+@st.cache_data(max_entries=ANALYSIS_CACHE_ENTRIES, show_spinner=False)
+def analyze_document(text_hash, _text):
+    """Entities, clauses and risks of a document text"""
+    clauses = identify_clauses(_text)
+    return {
+        "entities": extract_legal_entities(_text),
+        "clauses": clauses,
+        "risks": assess_risks(clauses)
+    }
+
+# A resource cache: the index is shared read-only, not copied on every access
+@st.cache_resource(max_entries=ANALYSIS_CACHE_ENTRIES, show_spinner=False)
+def build_search_index(text_hash, _handle):
+    """Positional inverted index of a document for the Search Documents page"""
+    return DocumentIndex(_handle.text)
+
+# Like build_search_index, these take the text handle rather than the text, so the
+# text is only read (and decompressed) on a cache miss
+@st.cache_data(max_entries=ANALYSIS_CACHE_ENTRIES * 4, show_spinner=False)
+def word_count(text_hash, _handle):
+    return len(_handle.text.split())
+
+@st.cache_data(max_entries=ANALYSIS_CACHE_ENTRIES * 4, show_spinner=False)
+def search_snippets(text_hash, query, _handle, _hits):
+    """Highlighted snippets of a document's hits for a query (the hits follow from the text and query)"""
+    return snippets(_handle.text, _hits)
+
+@st.cache_data(max_entries=ANALYSIS_CACHE_ENTRIES, show_spinner=False)
+def compare_clauses(doc1_hash, doc2_hash, _analysis1, _analysis2, _handle1, _handle2):
+    """Per-clause-type presence, counts and word-level similarity of two analysed documents"""
+    text1, text2 = _handle1.text, _handle2.text
+    result = {}
+    all_clause_types = set(list(_analysis1["clauses"].keys()) + list(_analysis2["clauses"].keys()))
+    
+    for clause_type in all_clause_types:
+        doc1_has = clause_type in _analysis1["clauses"] and len(_analysis1["clauses"][clause_type]) > 0
+        doc2_has = clause_type in _analysis2["clauses"] and len(_analysis2["clauses"][clause_type]) > 0
+        
+        # Word-level similarity of the clause texts (0 when either side has none)
+        similarity = 0.0
+        if doc1_has and doc2_has:
+            words1 = " ".join(text1[start:end] for _, start, end in _analysis1["clauses"][clause_type]).split()
+            words2 = " ".join(text2[start:end] for _, start, end in _analysis2["clauses"][clause_type]).split()
+            similarity = difflib.SequenceMatcher(None, words1, words2).ratio()
+        
+        result[clause_type] = {
+            "doc1_has": doc1_has,
+            "doc2_has": doc2_has,
+            "doc1_count": len(_analysis1["clauses"].get(clause_type, [])),
+            "doc2_count": len(_analysis2["clauses"].get(clause_type, [])),
+            "similarity": similarity
+        }
+    
+    return result
+
 # Compare two documents
 def compare_documents(doc1, doc2, analysis1, analysis2):
     """Compare two legal documents and identify similarities and differences"""
@@ -298,13 +396,14 @@ def compare_documents(doc1, doc2, analysis1, analysis2):
             "doc2_name": doc2["filename"],
             "doc1_size": f"{doc1['size']/1024:.1f} KB",
             "doc2_size": f"{doc2['size']/1024:.1f} KB",
-            "doc1_word_count": len(doc1["content"].split()),
-            "doc2_word_count": len(doc2["content"].split())
+            "doc1_word_count": word_count(doc1["content_hash"], doc1["text"]),
+            "doc2_word_count": word_count(doc2["content_hash"], doc2["text"])
         },
-        "clauses": {},
+        "clauses": compare_clauses(doc1["content_hash"], doc2["content_hash"], analysis1, analysis2,
+                                  doc1["text"], doc2["text"]),
         "risks": {
             "doc1_risks": len(analysis1["risks"]),
-            "doc2_risks": len(analysis1["risks"]),
+            "doc2_risks": len(analysis2["risks"]),
             "doc1_high_risks": len([r for r in analysis1["risks"] if r["severity"] == "High"]),
             "doc2_high_risks": len([r for r in analysis2["risks"] if r["severity"] == "High"])
         },
@@ -314,21 +413,135 @@ def compare_documents(doc1, doc2, analysis1, analysis2):
         }
     }
     
-    # Compare clauses
-    all_clause_types = set(list(analysis1["clauses"].keys()) + list(analysis2["clauses"].keys()))
+    return comparison
+
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_TYPES = {".pdf": "application/pdf", ".txt": "text/plain"}
+
+# Bounded pool shared by all sessions, so a large batch cannot swamp the server
+@st.cache_resource
+def get_upload_executor():
+    return ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="upload")
+
+# Limits on what one zip archive may expand to, checked against the sizes it declares
+ZIP_MAX_FILES = int(os.getenv("ZIP_MAX_FILES", "500"))
+ZIP_MAX_BYTES = int(os.getenv("ZIP_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Keyed by the archive's hash, so reruns of the upload page don't decompress it again;
+# few entries, as each holds the expanded files
+@st.cache_data(max_entries=8, show_spinner=False)
+def _expand_zip(zip_hash, _zip_bytes, zip_name):
+    """The PDF and TXT members of one zip archive as (name, bytes, type), and (name, error) pairs"""
+    files, errors = [], []
+    try:
+        with zipfile.ZipFile(io.BytesIO(_zip_bytes)) as archive:
+            members = []
+            for member in archive.infolist():
+                name = member.filename
+                basename = os.path.basename(name)
+                if member.is_dir() or name.startswith("__MACOSX/") or basename.startswith("."):
+                    continue
+                file_type = UPLOAD_TYPES.get(os.path.splitext(basename)[1].lower())
+                if file_type:
+                    members.append((member, file_type))
+            
+            if len(members) > ZIP_MAX_FILES:
+                return [], [(zip_name, f"Zip archive holds {len(members)} files; the limit is {ZIP_MAX_FILES}")]
+            total_size = sum(member.file_size for member, _ in members)
+            if total_size > ZIP_MAX_BYTES:
+                return [], [(zip_name, f"Zip archive expands to {total_size / 1024 / 1024:.1f} MB; "
+                                       f"the limit is {ZIP_MAX_BYTES / 1024 / 1024:.1f} MB")]
+            
+            for member, file_type in members:
+                # Encrypted or unsupported members, and corrupt data, fail only that file
+                try:
+                    files.append((member.filename, archive.read(member), file_type))
+                except (zipfile.BadZipFile, RuntimeError, NotImplementedError, zlib.error, EOFError, OSError) as e:
+                    errors.append((f"{zip_name}/{member.filename}", f"Cannot extract file: {e}"))
+    except (zipfile.BadZipFile, OSError) as e:
+        errors.append((zip_name, f"Cannot read zip archive: {e}"))
+    return files, errors
+
+def expand_uploads(uploaded_files):
+    """Uploaded files as (name, bytes, type), with the PDF and TXT files inside zip archives
     
-    for clause_type in all_clause_types:
-        doc1_has = clause_type in analysis1["clauses"] and len(analysis1["clauses"][clause_type]) > 0
-        doc2_has = clause_type in analysis2["clauses"] and len(analysis2["clauses"][clause_type]) > 0
-        
-        comparison["clauses"][clause_type] = {
-            "doc1_has": doc1_has,
-            "doc2_has": doc2_has,
-            "doc1_count": len(analysis1["clauses"].get(clause_type, [])),
-            "doc2_count": len(analysis2["clauses"].get(clause_type, []))
-        }
+    Returns the files and a list of (name, error) for archives, or files in them, that could not be read.
+    """
+    files, errors = [], []
+    for uploaded_file in uploaded_files:
+        data = uploaded_file.getvalue()
+        if not uploaded_file.name.lower().endswith(".zip"):
+            files.append((uploaded_file.name, data, uploaded_file.type))
+            continue
+        archive_files, archive_errors = _expand_zip(content_hash(data), data, uploaded_file.name)
+        files.extend(archive_files)
+        errors.extend(archive_errors)
+    return files, errors
+
+def process_document(filename, data, file_type):
+    """Extract, analyze and index one file; runs on the upload pool, so it must not write to the page"""
+    pdf_hash = None
+    if file_type == "application/pdf":
+        pdf_hash = content_hash(data)
+        document_text = pdf_text(data, pdf_hash)
+    else:
+        document_text = data.decode("utf-8")
     
-    return comparison
+    # Extract entities and clauses (cached by content hash)
+    text_hash = content_hash(document_text)
+    analysis = analyze_document(text_hash, document_text)
+    handle = get_text_store().put(document_text, text_hash, alias=pdf_hash)
+    build_search_index(text_hash, handle)
+    
+    document = {
+        "id": str(uuid.uuid4()),
+        "filename": filename,
+        "text": handle,
+        "content_hash": text_hash,
+        "file_type": file_type,
+        "size": len(data),
+        "upload_date": pd.Timestamp.now().strftime("%Y-%m-%d")
+    }
+    return document, analysis
+
+def process_uploads(files):
+    """Process files concurrently, showing each file's status and storing documents as they finish"""
+    ctx = get_script_run_ctx()
+    
+    def run(filename, data, file_type):
+        # Cached functions look up the session's runtime through the script context
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return process_document(filename, data, file_type)
+    
+    progress = st.progress(0.0, text=f"Processing 0 of {len(files)} documents...")
+    rows = []
+    for filename, _, _ in files:
+        rows.append(st.empty())
+        rows[-1].markdown(f"⏳ {filename}")
+    
+    executor = get_upload_executor()
+    futures = {executor.submit(run, *file): i for i, file in enumerate(files)}
+    processed, failed = 0, 0
+    for future in as_completed(futures):
+        row = rows[futures[future]]
+        filename = files[futures[future]][0]
+        try:
+            document, analysis = future.result()
+        except Exception as e:
+            failed += 1
+            row.markdown(f"❌ {filename}: {e}")
+        else:
+            processed += 1
+            st.session_state.documents[document["id"]] = document
+            st.session_state.analysis_results[document["id"]] = analysis
+            st.session_state.current_document = document["id"]
+            clause_count = sum(len(clauses) for clauses in analysis["clauses"].values())
+            row.markdown(f"✅ {filename}: {clause_count} clauses")
+        done = processed + failed
+        progress.progress(done / len(files), text=f"Processing {done} of {len(files)} documents...")
+    progress.progress(1.0, text=f"Processed {processed} of {len(files)} documents" +
+                      (f", {failed} failed" if failed else ""))
+    return processed, failed
 
 # Sidebar navigation
 with st.sidebar:
@@ -370,77 +583,54 @@ if menu == "Document Upload":
     st.title("📄 Document Upload")
     
     st.markdown('<div class="card">', unsafe_allow_html=True)
-    st.markdown("### Upload a Document")
-    st.markdown("Supported formats: PDF, TXT")
+    st.markdown("### Upload Documents")
+    st.markdown("Supported formats: PDF, TXT, or a ZIP archive of them")
     
     # File uploader with processing
-    uploaded_file = st.file_uploader("Choose a file", type=["pdf", "txt"], label_visibility="collapsed")
+    uploaded_files = st.file_uploader("Choose files", type=["pdf", "txt", "zip"],
+                                      accept_multiple_files=True, label_visibility="collapsed")
     
-    if uploaded_file:
-        col1, col2 = st.columns([1, 1])
+    if uploaded_files:
+        files, archive_errors = expand_uploads(uploaded_files)
+        for archive_name, error in archive_errors:
+            st.error(f"{archive_name}: {error}")
         
-        with col1:
-            st.success(f"File '{uploaded_file.name}' uploaded successfully!")
-            st.write(f"**Size:** {uploaded_file.size} bytes")
-            st.write(f"**Type:** {uploaded_file.type}")
+        if files:
+            col1, col2 = st.columns([1, 1])
             
-            # Process button
-            if st.button("Process Document", type="primary", use_container_width=True):
-                with st.spinner("Processing document..."):
-                    # Generate a unique ID for the document
-                    import uuid
-                    doc_id = str(uuid.uuid4())
-                    
-                    # Extract text based on file type
-                    if uploaded_file.type == "application/pdf":
-                        document_text = extract_text_from_pdf(uploaded_file.getvalue())
-                    else:
-                        document_text = uploaded_file.getvalue().decode("utf-8")
-                    
-                    # Extract entities and clauses
-                    entities = extract_legal_entities(document_text)
-                    clauses = identify_clauses(document_text)
-                    risks = assess_risks(clauses)
-                    
-                    # Store document and analysis in session state
-                    st.session_state.documents[doc_id] = {
-                        "id": doc_id,
-                        "filename": uploaded_file.name,
-                        "content": document_text,
-                        "file_type": uploaded_file.type,
-                        "size": uploaded_file.size,
-                        "upload_date": pd.Timestamp.now().strftime("%Y-%m-%d")
-                    }
-                    
-                    st.session_state.analysis_results[doc_id] = {
-                        "entities": entities,
-                        "clauses": clauses,
-                        "risks": risks
-                    }
-                    
-                    # Set current document
-                    st.session_state.current_document = doc_id
-                    
-                    # Navigate to analysis
-                    st.success("Document processed successfully! View analysis in the Document Analysis tab.")
-                    st.markdown(f"[Go to Document Analysis](#document-analysis)")
-        
-        with col2:
-            st.subheader("Document Preview")
-            if uploaded_file.type == "application/pdf":
-                # Try to display first page as text
-                try:
-                    text = extract_text_from_pdf(uploaded_file.getvalue())
-                    st.text_area("Text Preview", text[:1000] + "..." if len(text) > 1000 else text, height=400)
-                except Exception as e:
-                    st.error(f"Cannot preview PDF: {e}")
-            else:
-                # For text files, show the content
-                try:
-                    text_content = uploaded_file.getvalue().decode("utf-8")
-                    st.text_area("", text_content[:1000] + "..." if len(text_content) > 1000 else text_content, height=400)
-                except:
-                    st.error("Could not decode file content")
+            with col1:
+                st.success(f"{len(files)} file(s) ready to process")
+                st.dataframe(pd.DataFrame([
+                    {"Filename": filename, "Type": file_type, "Size (KB)": f"{len(data)/1024:.1f}"}
+                    for filename, data, file_type in files
+                ]), use_container_width=True)
+                
+                # Process button
+                if st.button("Process Documents", type="primary", use_container_width=True):
+                    processed, failed = process_uploads(files)
+                    if processed:
+                        st.success("Documents processed! View analysis in the Document Analysis tab.")
+                        st.markdown(f"[Go to Document Analysis](#document-analysis)")
+            
+            with col2:
+                st.subheader("Document Preview")
+                preview_name = st.selectbox("File", [filename for filename, _, _ in files]) if len(files) > 1 else files[0][0]
+                _, preview_data, preview_type = next(file for file in files if file[0] == preview_name)
+                if preview_type == "application/pdf":
+                    # Try to display first page as text
+                    try:
+                        st.text_area("Text Preview", _cached_pdf_preview(content_hash(preview_data), preview_data), height=400)
+                    except Exception as e:
+                        st.error(f"Cannot preview PDF: {e}")
+                else:
+                    # For text files, show the content
+                    try:
+                        text_content = preview_data.decode("utf-8")
+                        st.text_area("", text_content[:1000] + "..." if len(text_content) > 1000 else text_content, height=400)
+                    except:
+                        st.error("Could not decode file content")
+        else:
+            st.warning("No PDF or TXT files found in the upload.")
     
     st.markdown("</div>", unsafe_allow_html=True)
     
@@ -473,6 +663,7 @@ elif menu == "Document Analysis":
         doc_id = st.session_state.current_document
         document = st.session_state.documents[doc_id]
         analysis = st.session_state.analysis_results[doc_id]
+        content = stored_text(document)
         
         # Tabs for different analysis views
         tabs = st.tabs(["📝 Overview", "🔖 Clauses", "👥 Entities", "⚠️ Risk Assessment", "📊 Summary"])
@@ -492,12 +683,12 @@ elif menu == "Document Analysis":
                 st.markdown(f"**Size:** {document['size']/1024:.1f} KB")
                 
                 # Count paragraphs
-                paragraph_count = len(document['content'].split('\n\n'))
+                paragraph_count = len(content.split('\n\n'))
                 st.markdown(f"**Paragraphs:** {paragraph_count}")
                 
                 # Estimated word count
-                word_count = len(document['content'].split())
-                st.markdown(f"**Words:** {word_count}")
+                num_words = word_count(document['content_hash'], document['text'])
+                st.markdown(f"**Words:** {num_words}")
             
             st.markdown("</div>", unsafe_allow_html=True)
             
@@ -505,7 +696,7 @@ elif menu == "Document Analysis":
             st.markdown('<div class="card">', unsafe_allow_html=True)
             st.subheader("Document Content")
             
-            st.text_area("", document['content'][:2000] + ("..." if len(document['content']) > 2000 else ""), height=400)
+            st.text_area("", content[:2000] + ("..." if len(content) > 2000 else ""), height=400)
             
             st.markdown("</div>", unsafe_allow_html=True)
         
@@ -525,7 +716,8 @@ elif menu == "Document Analysis":
                     if clause_list:
                         clause_name = clause_type.replace('_', ' ').title()
                         with st.expander(f"{clause_name} ({len(clause_list)})", expanded=False):
-                            for i, (preview, full_text) in enumerate(clause_list):
+                            for i, (preview, start, end) in enumerate(clause_list):
+                                full_text = content[start:end]
                                 st.markdown(f"**Clause {i+1}:**")
                                 st.text_area(f"Content {i+1}", full_text, height=100, key=f"clause_{clause_type}_{i}")
                                 st.markdown("---")
@@ -713,7 +905,7 @@ elif menu == "Document Analysis":
             
             # Generate simple summary
             summary = f"""
-            This document is titled "{document['filename']}" and contains approximately {word_count} words.
+            This document is titled "{document['filename']}" and contains approximately {num_words} words.
             
             Key findings from the analysis:
             
@@ -778,7 +970,8 @@ elif menu == "Compare Documents":
             
             if doc1_id:
                 st.write(f"**Size:** {st.session_state.documents[doc1_id]['size']/1024:.1f} KB")
-                st.write(f"**Words:** {len(st.session_state.documents[doc1_id]['content'].split())}")
+                doc1 = st.session_state.documents[doc1_id]
+                st.write(f"**Words:** {word_count(doc1['content_hash'], doc1['text'])}")
         
         with col2:
             st.markdown("### Second Document")
@@ -788,7 +981,8 @@ elif menu == "Compare Documents":
             
             if doc2_id:
                 st.write(f"**Size:** {st.session_state.documents[doc2_id]['size']/1024:.1f} KB")
-                st.write(f"**Words:** {len(st.session_state.documents[doc2_id]['content'].split())}")
+                doc2 = st.session_state.documents[doc2_id]
+                st.write(f"**Words:** {word_count(doc2['content_hash'], doc2['text'])}")
         
         if doc1_id and doc2_id and st.button("Compare Documents", type="primary"):
             with st.spinner("Comparing documents..."):
@@ -846,7 +1040,7 @@ elif menu == "Compare Documents":
             
             # Create HTML table
             st.markdown('<table class="styled-table">', unsafe_allow_html=True)
-            st.markdown(f'<thead><tr><th>Clause Type</th><th>{doc1_name}</th><th>{doc2_name}</th><th>Difference</th></tr></thead><tbody>', unsafe_allow_html=True)
+            st.markdown(f'<thead><tr><th>Clause Type</th><th>{doc1_name}</th><th>{doc2_name}</th><th>Difference</th><th>Similarity</th></tr></thead><tbody>', unsafe_allow_html=True)
             
             for clause_type, data in comparison["clauses"].items():
                 formatted_clause_type = clause_type.replace('_', ' ').title()
@@ -867,7 +1061,7 @@ elif menu == "Compare Documents":
                 if (data["doc1_has"] and not data["doc2_has"]) or (not data["doc1_has"] and data["doc2_has"]):
                     row_style = "background-color:#fef6e4;"
                 
-                st.markdown(f'<tr style="{row_style}"><td>{formatted_clause_type}</td><td>{doc1_count}</td><td>{doc2_count}</td><td>{diff_text}</td></tr>', unsafe_allow_html=True)
+                st.markdown(f'<tr style="{row_style}"><td>{formatted_clause_type}</td><td>{doc1_count}</td><td>{doc2_count}</td><td>{diff_text}</td><td>{data["similarity"]:.0%}</td></tr>', unsafe_allow_html=True)
             
             st.markdown('</tbody></table>', unsafe_allow_html=True)
             
@@ -899,43 +1093,28 @@ elif menu == "Search Documents":
         st.subheader("Search Documents")
         
         search_query = st.text_input("Enter your search query", placeholder="e.g., termination notice period")
+        st.caption('Use "quotes" for exact phrases and a trailing * for prefixes, e.g. "notice period" terminat*')
         
         if search_query and st.button("Search", type="primary"):
-            # Perform basic search across documents
-            search_results = []
-            
-            for doc_id, doc in st.session_state.documents.items():
-                # Simple text search
-                content = doc["content"].lower()
-                query = search_query.lower()
-                
-                if query in content:
-                    # Get context around match
-                    index = content.find(query)
-                    start = max(0, index - 100)
-                    end = min(len(content), index + len(query) + 100)
-                    
-                    # Get context
-                    if start > 0:
-                        context = "..." + content[start:end] + "..."
-                    else:
-                        context = content[start:end] + "..."
-                    
-                    # Highlight the match
-                    highlighted = context.replace(query, f"<mark>{query}</mark>")
-                    
-                    # Calculate a simple relevance score
-                    relevance = content.count(query) * 10
-                    
-                    search_results.append({
-                        "doc_id": doc_id,
-                        "filename": doc["filename"],
-                        "context": highlighted,
-                        "relevance": min(relevance, 100)  # Cap at 100%
-                    })
+            # Search the per-document positional indexes (built once per content hash)
+            indexes = {
+                doc_id: build_search_index(doc["content_hash"], doc["text"])
+                for doc_id, doc in st.session_state.documents.items()
+            }
+            matches = search(indexes, search_query)
+            top_score = matches[0]["score"] if matches else 1
             
-            # Sort by relevance
-            search_results.sort(key=lambda x: x["relevance"], reverse=True)
+            search_results = []
+            for match in matches:
+                doc = st.session_state.documents[match["doc_id"]]
+                search_results.append({
+                    "doc_id": match["doc_id"],
+                    "filename": doc["filename"],
+                    "context": "<br>".join(search_snippets(doc["content_hash"], search_query, doc["text"], match["hits"])),
+                    "hits": len(match["hits"]),
+                    # Relative to the best match
+                    "relevance": round(100 * match["score"] / top_score)
+                })
             
             if search_results:
                 st.success(f"Found {len(search_results)} matching documents!")
@@ -946,7 +1125,7 @@ elif menu == "Search Documents":
                         f'<div style="padding:15px; background-color:#f8fafc; border:1px solid #e2e8f0; border-radius:5px; margin-bottom:15px;">'
                         f'<h4 style="margin-top:0;">{result["filename"]}</h4>'
                         f'<p>{result["context"]}</p>'
-                        f'<p><strong>Relevance Score:</strong> {result["relevance"]}%</p>'
+                        f'<p><strong>Relevance Score:</strong> {result["relevance"]}% ({result["hits"]} matches)</p>'
                         f'<a href="#" onclick="return false;">View Document</a>'
                         f'</div>', 
                         unsafe_allow_html=True
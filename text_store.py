@@ -0,0 +1,159 @@
+import hashlib
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class _Entry:
+    __slots__ = ("data", "compressed", "length", "references", "aliases")
+
+    def __init__(self, data: bytes, compressed: bool, length: int):
+        self.data = data
+        self.compressed = compressed
+        self.length = length
+        self.references = 0
+        self.aliases = set()
+
+
+class TextHandle:
+    """A session's reference to a text in the shared store.
+
+    The reference is released when the handle is garbage collected, e.g.
+    when the Streamlit session holding it ends.
+    """
+
+    __slots__ = ("content_hash", "length", "_store", "__weakref__")
+
+    def __init__(self, store: "TextStore", content_hash: str, length: int):
+        self.content_hash = content_hash
+        self.length = length
+        self._store = store
+        weakref.finalize(self, store._release, content_hash)
+
+    @property
+    def text(self) -> str:
+        return self._store.get(self.content_hash)
+
+    def slice(self, start: int, end: int) -> str:
+        return self.text[start:end]
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __copy__(self) -> "TextHandle":
+        return self._store.acquire(self.content_hash)
+
+    def __deepcopy__(self, memo) -> "TextHandle":
+        return self.__copy__()
+
+
+class TextStore:
+    """Process-wide, content-addressed, reference-counted text store.
+
+    Each distinct text is kept once, optionally zlib-compressed, no matter
+    how many sessions hold it, and dropped when the last handle is released.
+    A few recently read texts are kept decompressed to make reruns cheap.
+    Texts can also be found by an alias, e.g. the hash of the PDF they were
+    extracted from, for as long as they are stored.
+    """
+
+    def __init__(self, compress: bool = True, compress_min_chars: int = 4096, hot_entries: int = 8):
+        self.compress = compress
+        self.compress_min_chars = compress_min_chars
+        self.hot_entries = hot_entries
+        self._entries: Dict[str, _Entry] = {}
+        self._hot: "OrderedDict[str, str]" = OrderedDict()
+        self._aliases: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def put(self, text: str, content_hash: Optional[str] = None, alias: Optional[str] = None) -> TextHandle:
+        """Store a text (once per content) and return a new handle to it"""
+        content_hash = content_hash or self.content_hash(text)
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is None:
+                data = text.encode("utf-8")
+                compressed = self.compress and len(text) >= self.compress_min_chars
+                if compressed:
+                    data = zlib.compress(data, 6)
+                entry = self._entries[content_hash] = _Entry(data, compressed, len(text))
+                # A new text is about to be indexed and shown
+                self._remember(content_hash, text)
+            entry.references += 1
+            if alias is not None:
+                entry.aliases.add(alias)
+                self._aliases[alias] = content_hash
+        return TextHandle(self, content_hash, entry.length)
+
+    def find(self, alias: str) -> Optional[TextHandle]:
+        """A new handle to the text stored under an alias, or None once it has been dropped"""
+        with self._lock:
+            content_hash = self._aliases.get(alias)
+            if content_hash is None:
+                return None
+            entry = self._entries[content_hash]
+            entry.references += 1
+        return TextHandle(self, content_hash, entry.length)
+
+    def acquire(self, content_hash: str) -> TextHandle:
+        """Another handle to a text that is already stored"""
+        with self._lock:
+            entry = self._entries[content_hash]
+            entry.references += 1
+        return TextHandle(self, content_hash, entry.length)
+
+    def _release(self, content_hash: str):
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is None:
+                return
+            entry.references -= 1
+            if entry.references <= 0:
+                del self._entries[content_hash]
+                self._hot.pop(content_hash, None)
+                for alias in entry.aliases:
+                    if self._aliases.get(alias) == content_hash:
+                        del self._aliases[alias]
+
+    def get(self, content_hash: str) -> str:
+        with self._lock:
+            text = self._hot.get(content_hash)
+            if text is not None:
+                self._hot.move_to_end(content_hash)
+                return text
+            entry = self._entries[content_hash]
+        data = zlib.decompress(entry.data) if entry.compressed else entry.data
+        text = data.decode("utf-8")
+        with self._lock:
+            if content_hash in self._entries:
+                self._remember(content_hash, text)
+        return text
+
+    def _remember(self, content_hash: str, text: str):
+        """Keep a text decompressed among the hot entries; the lock must be held"""
+        self._hot[content_hash] = text
+        self._hot.move_to_end(content_hash)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "texts": len(self._entries),
+                "references": sum(entry.references for entry in self._entries.values()),
+                "stored_bytes": sum(len(entry.data) for entry in self._entries.values()),
+                "text_chars": sum(entry.length for entry in self._entries.values()),
+                "hot_texts": len(self._hot),
+            }